@@ -0,0 +1,93 @@
+###
+#  @file    bench_check_playlists.py
+#
+#  @brief   Benchmark Of Playlist Membership Lookups
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from playlists import PlaylistHandler  # noqa: E402
+
+
+def linear_check_playlists(handler: PlaylistHandler, url: str) -> list:
+    """ Lookup of 'url' by scanning every playlist, as check_playlists did before the index. """
+    return ([spec for spec in handler.playlists if url in handler.playlists[spec]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PlaylistHandler.check_playlists benchmark")
+    parser.add_argument("--entries", type=int, default=100_000,
+                        help="Total amount of playlist entries")
+    parser.add_argument("--playlists", type=int, default=40,
+                        help="Amount of playlists the entries are spread across")
+    parser.add_argument("--lookups", type=int, default=200,
+                        help="Amount of urls to look up")
+    args = parser.parse_args()
+
+    random.seed(0)
+    # Every song is in one playlist and a tenth are in a second one
+    songs = [f"https://www.youtube.com/watch?v={i:011d}" for i in range(args.entries)]
+    playlist_urls = [[] for _ in range(args.playlists)]
+    for song in songs:
+        playlist_urls[random.randrange(args.playlists)].append(song)
+        if (0 == random.randrange(10)):
+            playlist_urls[random.randrange(args.playlists)].append(song)
+
+    handler = PlaylistHandler(0)
+    handler.urls_populated = True
+    start = time.perf_counter()
+    for index, urls in enumerate(playlist_urls):
+        handler._set_playlist((f"https://www.youtube.com/playlist?list={index}", f"pl{index}"),
+                              urls)
+    build_time = time.perf_counter() - start
+
+    lookups = random.sample(songs, args.lookups)
+
+    start = time.perf_counter()
+    linear_results = [linear_check_playlists(handler, url) for url in lookups]
+    linear_time = (time.perf_counter() - start) / args.lookups
+
+    start = time.perf_counter()
+    indexed_results = [handler.check_playlists(url) for url in lookups]
+    indexed_time = (time.perf_counter() - start) / args.lookups
+
+    assert linear_results == indexed_results
+    total = sum(len(urls) for urls in playlist_urls)
+    print(f"playlists: {args.playlists} entries: {total} lookups: {args.lookups}")
+    print(f"index build:    {build_time*1000:10.3f} ms")
+    print(f"linear scan:    {linear_time*1000:10.3f} ms/lookup")
+    print(f"reverse index:  {indexed_time*1000:10.3f} ms/lookup")
+
+
+if __name__ == "__main__":
+    main()
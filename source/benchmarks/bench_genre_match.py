@@ -0,0 +1,92 @@
+###
+#  @file    bench_genre_match.py
+#
+#  @brief   Benchmark Of Genre Matching Against The Genre Registry
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import globals  # noqa: E402
+from genres import GenreRegistry  # noqa: E402
+
+QUERIES = ["Drum n Bass", "DnB", "hiphop", "Lo-Fi Hip Hop", "synthpop", "RnB", "tech-house",
+           "dubstepp", "Rock n Roll", "Alt Rock", "sad", "chill", "trapp", "phonk"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genre registry matching benchmark")
+    parser.add_argument("--scale", type=int, default=10,
+                        help="Multiple of the size of the genre list to match against")
+    parser.add_argument("--lookups", type=int, default=20_000,
+                        help="Amount of lookups")
+    args = parser.parse_args()
+
+    with open(globals.GENRE_PATH, "r") as fptr:
+        genres = json.load(fptr)
+
+    # Grow the list with made up genres built from the words of the real ones
+    random.seed(0)
+    words = sorted({word for genre in genres for word in genre.split()})
+    grown = list(genres)
+    while (len(grown) < len(genres) * args.scale):
+        grown.append(" ".join(random.sample(words, random.randint(2, 3))))
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as fptr:
+        json.dump(grown, fptr)
+        fptr.flush()
+
+        start = time.perf_counter()
+        registry = GenreRegistry(fptr.name)
+        build_time = time.perf_counter() - start
+
+    queries = [random.choice(QUERIES) for _ in range(args.lookups)]
+    times = []
+    for query in queries:
+        # Measure the fuzzy matching itself rather than the match cache
+        registry._match_cache.clear()
+        start = time.perf_counter()
+        registry.match(query)
+        times.append(time.perf_counter() - start)
+    times.sort()
+
+    print(f"genres: {len(registry)} lookups: {args.lookups}")
+    print(f"index build:  {build_time*1000:10.3f} ms")
+    print(f"mean lookup:  {sum(times)/len(times)*1000:10.3f} ms")
+    print(f"p99 lookup:   {times[int(len(times)*0.99)]*1000:10.3f} ms")
+    print(f"max lookup:   {times[-1]*1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+###
+#  @file    bench_remux.py
+#
+#  @brief   Benchmark Of Audio Transcoding Against Remuxing
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import os
+import sys
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import globals  # noqa: E402
+from yt_dlp import YoutubeDL  # noqa: E402
+from downloader import DownloadManager  # noqa: E402
+from postprocess import DEFAULT_AUDIO_CODEC, preferred_audio_codec  # noqa: E402
+
+# (acodec reported by yt-dlp, ext, ffmpeg encoder) of the generated source tracks
+SOURCES = [
+    ("opus", "webm", "libopus"),
+    ("vorbis", "webm", "libvorbis"),
+    ("mp4a.40.2", "m4a", "aac"),
+]
+
+
+def children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage.ru_utime + usage.ru_stime)
+
+
+def generate_source(path: str, encoder: str, duration: int):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+                    "-i", f"sine=frequency=440:duration={duration}",
+                    "-c:a", encoder, path], check=True)
+
+
+def extract_audio(tmp_dir: str, source: str, ext: str, acodec: str, codec: str) -> float:
+    """ Run FFmpegExtractAudio targeting 'codec' on a copy of 'source'.
+
+        Returns:
+            CPU seconds spent by ffmpeg
+    """
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    path = shutil.copy(source, work_dir)
+    opts = {"quiet": True, "paths": {"home": work_dir}, "postprocessors": [
+        pp | {"preferredcodec": codec} for pp in DownloadManager.YDL_OPTS_DOWNLOAD["postprocessors"]
+        if ("FFmpegExtractAudio" == pp["key"])]}
+
+    with YoutubeDL(opts) as ydl:
+        start = children_cpu_seconds()
+        ydl.post_process(path, {"id": "bench", "ext": ext, "acodec": acodec, "filepath": path})
+        return (children_cpu_seconds() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio transcode against remux benchmark")
+    parser.add_argument("--duration", type=int, default=240,
+                        help="Length of the generated tracks in seconds")
+    args = parser.parse_args()
+
+    if (not shutil.which("ffmpeg")):
+        sys.exit("ffmpeg is required to run this benchmark")
+    globals.KEEP_SOURCE_CODEC = True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"track length: {args.duration}s")
+        print(f"{'source':<10} {'always ' + DEFAULT_AUDIO_CODEC:>14} {'format aware':>14}")
+        for acodec, ext, encoder in SOURCES:
+            source = os.path.join(tmp_dir, f"source_{encoder}.{ext}")
+            generate_source(source, encoder, args.duration)
+
+            always_default = extract_audio(tmp_dir, source, ext, acodec, DEFAULT_AUDIO_CODEC)
+            format_aware = extract_audio(tmp_dir, source, ext, acodec,
+                                         preferred_audio_codec({"acodec": acodec}))
+            print(f"{acodec:<10} {always_default:>12.3f} s {format_aware:>12.3f} s")
+
+
+if __name__ == "__main__":
+    main()
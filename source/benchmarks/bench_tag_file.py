@@ -0,0 +1,130 @@
+###
+#  @file    bench_tag_file.py
+#
+#  @brief   Bytes written per retag of audio files
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PIL import Image  # noqa: E402
+from utils.common import MetadataCtx  # noqa: E402
+from metadata import tag_file, delete_file_tags  # noqa: E402
+
+# (extension, ffmpeg encoder) of the generated tracks
+SOURCES = [
+    ("opus", "libopus"),
+    ("mp3", "libmp3lame"),
+    ("m4a", "aac"),
+]
+SUPPORTED_EXTENSIONS = {".opus", ".ogg", ".flac", ".mp3", ".m4a", ".mp4"}
+
+
+def bytes_written() -> int:
+    """ Bytes passed to write calls by this process so far. """
+    with open("/proc/self/io", "r") as fptr:
+        for line in fptr:
+            if (line.startswith("wchar:")):
+                return (int(line.split()[1]))
+    return (0)
+
+
+def generate_sources(directory: str, duration: int):
+    for ext, encoder in SOURCES:
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+                        "-i", f"sine=frequency=440:duration={duration}",
+                        "-c:a", encoder, os.path.join(directory, f"source.{ext}")], check=True)
+
+
+def generate_cover(path: str):
+    Image.effect_noise((1200, 1200), 64).convert("RGB").save(path, "JPEG", quality=90)
+
+
+def measure(func) -> int:
+    start = bytes_written()
+    func()
+    return (bytes_written() - start)
+
+
+def retag(path: str, cover_url: str, title: str, single_pass: bool) -> int:
+    metadata = MetadataCtx(title=title, path=path, artist="Artist", artists=["Artist"],
+                           album="Album", genres=["Electronic"], thumbnail_url=cover_url,
+                           thumbnail_width=1200, thumbnail_height=1200)
+
+    def legacy():
+        delete_file_tags(path)
+        tag_file(metadata, False, None)
+
+    return (measure(lambda: tag_file(metadata, True, None)) if single_pass else measure(legacy))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes written per retag of audio files")
+    parser.add_argument("directory", nargs="?", default=None,
+                        help="Directory of audio files to retag copies of. "
+                        "Tracks are generated with ffmpeg when not given")
+    parser.add_argument("--duration", type=int, default=240,
+                        help="Length of the generated tracks in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = args.directory
+        if (source_dir is None):
+            if (not shutil.which("ffmpeg")):
+                sys.exit("ffmpeg is required to generate tracks, pass a directory of audio files")
+            source_dir = tempfile.mkdtemp(dir=tmp_dir)
+            generate_sources(source_dir, args.duration)
+
+        cover_path = os.path.join(tmp_dir, "cover.jpg")
+        generate_cover(cover_path)
+        cover_url = Path(cover_path).as_uri()
+
+        print(f"{'file':<32} {'size':>10} {'two pass':>10} {'one pass':>10} {'unchanged':>10}")
+        for name in sorted(os.listdir(source_dir)):
+            if (Path(name).suffix.lower() not in SUPPORTED_EXTENSIONS):
+                continue
+            path = shutil.copy(os.path.join(source_dir, name), tmp_dir)
+            # Tag once so every retag starts from a tagged file
+            retag(path, cover_url, "Initial", True)
+
+            two_pass = retag(path, cover_url, "Two pass", False)
+            one_pass = retag(path, cover_url, "One pass", True)
+            unchanged = retag(path, cover_url, "One pass", True)
+            print(f"{name[:32]:<32} {os.path.getsize(path):>10} {two_pass:>10} "
+                  f"{one_pass:>10} {unchanged:>10}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
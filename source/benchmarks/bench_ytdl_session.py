@@ -0,0 +1,87 @@
+###
+#  @file    bench_ytdl_session.py
+#
+#  @brief   Benchmark Of Per Entry YoutubeDL Construction Against Session Reuse
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from yt_dlp import YoutubeDL  # noqa: E402
+from downloader import DownloadManager  # noqa: E402
+from ytdl_session import YoutubeDLSession  # noqa: E402
+
+
+def build_opts(archive_path: str) -> dict:
+    return (DownloadManager.YDL_OPTS_DOWNLOAD | {
+        "quiet": True,
+        "verbose": False,
+        "paths": {"home": os.path.dirname(archive_path)},
+        "download_archive": archive_path,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YoutubeDL construction benchmark")
+    parser.add_argument("--entries", type=int, default=200,
+                        help="Amount of simulated entries")
+    parser.add_argument("--archive_size", type=int, default=5000,
+                        help="Amount of lines in the simulated download archive")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "archive")
+        with open(archive_path, "w") as fptr:
+            for i in range(args.archive_size):
+                fptr.write(f"youtube {i:011d}\n")
+        opts = build_opts(archive_path)
+
+        start = time.perf_counter()
+        for _ in range(args.entries):
+            with YoutubeDL(dict(opts)) as ydl:
+                ydl.in_download_archive({"id": "00000000000", "ie_key": "Youtube"})
+        per_entry = (time.perf_counter() - start) / args.entries
+
+        start = time.perf_counter()
+        with YoutubeDLSession(opts) as session:
+            for _ in range(args.entries):
+                session.get().in_download_archive({"id": "00000000000", "ie_key": "Youtube"})
+        session_per_entry = (time.perf_counter() - start) / args.entries
+
+    print(f"entries: {args.entries} archive lines: {args.archive_size}")
+    print(f"YoutubeDL per entry:  {per_entry*1000:8.3f} ms/entry")
+    print(f"YoutubeDLSession:     {session_per_entry*1000:8.3f} ms/entry")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+###
+#  @file    covers.py
+#
+#  @brief   Cover art normalization
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import io
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import globals
+from PIL import Image
+from utils.thumbnail_cache import get_thumbnail_cache
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the thumbnail cache keys of normalized covers, followed by the hash of the source
+# cover and the settings it was normalized with
+COVER_CACHE_KEY = "ctl-cover"
+COVER_WORKERS = 2
+
+# Modes of --album_covers. Covers are either embedded in every track, or written once per album
+# with a small thumbnail or nothing embedded in the tracks
+ALBUM_COVERS_EMBED = "embed"
+ALBUM_COVERS_THUMBNAIL = "thumbnail"
+ALBUM_COVERS_NONE = "none"
+ALBUM_COVER_MODES = [ALBUM_COVERS_EMBED, ALBUM_COVERS_THUMBNAIL, ALBUM_COVERS_NONE]
+# Longest side in pixels of the thumbnail embedded when album covers are shared
+ALBUM_THUMBNAIL_SIZE = 300
+ALBUM_COVER_DIR = "covers"
+ALBUM_COVER_NAME = "cover.jpg"
+ALBUM_COVER_OBJECTS_DIR = ".objects"
+# Hosts of Cover Art Archive images, the only covers written over an existing album cover
+ALBUM_COVER_HOSTS = ("coverartarchive.org", "archive.org")
+
+
+def is_album_cover_url(url: str) -> bool:
+    """ Whether 'url' is an image from the Cover Art Archive. """
+    host = (urlparse(url).hostname or "") if url else ""
+    return (any((host == album_host) or host.endswith("." + album_host)
+                for album_host in ALBUM_COVER_HOSTS))
+
+
+class CoverNormalizer:
+    """ Resizes covers to at most 'max_size' pixels on their longest side and re-encodes them as
+        JPEG at 'quality'. Covers that are already small enough JPEGs are kept as they are, and
+        a 'max_size' of 0 disables normalization. Results are stored in the thumbnail cache by
+        the hash of the source image and the normalization settings, so they are shared by
+        processes and kept between runs.
+
+        PIL releases the GIL while decoding, resizing and encoding, so covers are normalized on a
+        thread pool.
+    """
+
+    def __init__(self, max_size: int, quality: int, workers: int = COVER_WORKERS):
+        self.max_size = max_size
+        self.quality = quality
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _resize(self, data: bytes, max_size: int) -> bytes:
+        with Image.open(io.BytesIO(data)) as image:
+            if (("JPEG" == image.format) and ((not max_size) or (max(image.size) <= max_size))):
+                return (data)
+
+            if (max_size):
+                # Lets JPEGs be decoded at a reduced scale instead of decoding every pixel
+                image.draft("RGB", (max_size, max_size))
+            image = image.convert("RGB")
+            if (max_size):
+                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=self.quality, optimize=True)
+            return (output.getvalue())
+
+    def resize(self, data: bytes, max_size: int) -> bytes:
+        """ Get the cover 'data' as a JPEG of at most 'max_size' pixels on its longest side. A
+            'max_size' of None only re-encodes covers that aren't JPEGs.
+
+            Returns:
+                The resized cover, 'data' itself if it couldn't be read
+        """
+        if (not data):
+            return (data)
+
+        cache = get_thumbnail_cache()
+        key = f"{COVER_CACHE_KEY}:{hashlib.sha256(data).hexdigest()}:{max_size}:{self.quality}"
+        output = cache.lookup(key)
+        if (output is not None):
+            return (output)
+
+        try:
+            output = self._resize(data, max_size)
+        except Exception:
+            logger.warning("Unable to normalize cover, keeping it as is", exc_info=True)
+            return (data)
+
+        cache.put(key, output)
+        return (output)
+
+    def normalize(self, data: bytes) -> bytes:
+        """ Get the normalized version of the cover 'data'.
+
+            Returns:
+                The normalized cover, 'data' itself if it couldn't be read or needs no change
+        """
+        if (not self.max_size):
+            return (data)
+        return (self.resize(data, self.max_size))
+
+    def submit(self, function, *args) -> Future:
+        """ Run the cover processing 'function' on the worker pool.
+
+            Returns:
+                Future of the result of 'function'
+        """
+        with self.lock:
+            if (self.executor is None):
+                self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                   thread_name_prefix="ctl_covers")
+        return (self.executor.submit(function, *args))
+
+    def normalize_file(self, path: str) -> str:
+        """ Normalize the cover at 'path', replacing it with a JPEG.
+
+            Returns:
+                Path of the normalized cover
+        """
+        with open(path, "rb") as fptr:
+            data = fptr.read()
+        output = self.normalize(data)
+        if (output == data):
+            return (path)
+
+        output_path = os.path.splitext(path)[0] + ".jpg"
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as fptr:
+            fptr.write(output)
+        os.replace(tmp_path, output_path)
+        if (output_path != path):
+            os.remove(path)
+        return (output_path)
+
+    def close(self):
+        with self.lock:
+            if (self.executor is not None):
+                self.executor.shutdown(wait=True)
+                self.executor = None
+
+
+class AlbumCoverStore:
+    """ Shared cover files of albums, one '<root>/covers/<release mbid>/cover.jpg' per album.
+
+        Covers are stored once by content hash in '<root>/covers/.objects' and the cover files of
+        albums are hard links to them, so albums with identical covers share their storage.
+        Tracks are tagged with the release mbid (the MusicBrainz Album Id tag) which names the
+        folder of their album's cover.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.join(root, ALBUM_COVER_DIR)
+        self.objects = os.path.join(self.root, ALBUM_COVER_OBJECTS_DIR)
+        self.lock = threading.Lock()
+
+    def cover_path(self, release_mbid: str) -> str:
+        return (os.path.join(self.root, release_mbid, ALBUM_COVER_NAME))
+
+    def has(self, release_mbid: str) -> bool:
+        return (os.path.exists(self.cover_path(release_mbid)))
+
+    def _link(self, object_path: str, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        if (os.path.lexists(tmp_path)):
+            os.remove(tmp_path)
+        try:
+            os.link(object_path, tmp_path)
+        except OSError:
+            # File systems without hard links get a copy
+            shutil.copyfile(object_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def add(self, release_mbid: str, data: bytes) -> bytes:
+        """ Make 'data' the cover of the album 'release_mbid'. The cover is stored as a JPEG,
+            normalized to the cover settings.
+
+            Returns:
+                The stored cover
+        """
+        normalizer = get_cover_normalizer()
+        cover = normalizer.resize(data, normalizer.max_size or None)
+        object_path = os.path.join(self.objects, hashlib.sha256(cover).hexdigest() + ".jpg")
+        path = self.cover_path(release_mbid)
+
+        with self.lock:
+            if (not os.path.exists(object_path)):
+                os.makedirs(self.objects, exist_ok=True)
+                tmp_path = object_path + ".tmp"
+                with open(tmp_path, "wb") as fptr:
+                    fptr.write(cover)
+                os.replace(tmp_path, object_path)
+
+            if (not (os.path.exists(path) and os.path.samefile(path, object_path))):
+                self._link(object_path, path)
+        return (cover)
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+_album_stores = {}
+_album_stores_lock = threading.Lock()
+
+
+def get_cover_normalizer() -> CoverNormalizer:
+    """ Get the cover normalizer of the process, using globals.COVER_MAX_SIZE and
+        globals.COVER_QUALITY. """
+    global _normalizer
+    with _normalizer_lock:
+        if (_normalizer is None):
+            _normalizer = CoverNormalizer(globals.COVER_MAX_SIZE, globals.COVER_QUALITY)
+        return (_normalizer)
+
+
+def get_album_cover_store(root: str) -> AlbumCoverStore:
+    """ Get the album cover store of the music directory 'root'. """
+    root = os.path.abspath(root)
+    with _album_stores_lock:
+        if (root not in _album_stores):
+            _album_stores[root] = AlbumCoverStore(root)
+        return (_album_stores[root])
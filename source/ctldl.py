@@ -36,21 +36,28 @@ import os
 import sys
 import time
 import json
+import queue
 import atexit
 import signal
 import shelve
 import logging
 import datetime
+import threading
+import contextlib
 from pathlib import PurePath
 
 import globals
 import configargparse
 from tui import ctl_tui
-from playlists import PlaylistHandler
+from covers import ALBUM_COVER_MODES
+from genres import get_genre_registry
 from downloader import DownloadManager
 from utils.ctl_logging import setup_logging
+from journal import WorkJournal, JournalState
+from playlists import PlaylistHandler, PlaylistCache
 from metadata import fill_report_metadata, LyricHandler
 from music_brainz import musicbrainz_construct_user_agent
+from utils.retry import RetryScheduler, ProviderUnavailableError, backoff_delay
 
 from utils.common import (
     check_ytdlp_update,
@@ -61,18 +68,35 @@ from utils.common import (
 
 logger = logging.getLogger(__name__)
 
+# Amount of downloads allowed to wait for metadata before the download stage is paused
+DOWNLOAD_QUEUE_SIZE = 16
+# Times a song's metadata search is deferred while providers are unavailable before it is left to
+# the next run
+METADATA_MAX_DEFERRALS = 8
+# Songs whose lyrics are searched for at once by the metadata stage
+LYRICS_BATCH_SIZE = 16
+# Longest the metadata stage waits before checking whether an exit was requested
+STOP_POLL_INTERVAL = 1
+
 
 class CloudToLocal:
     def __init__(self, arguments):
         self.playlists_info = []
         self.retries = arguments.retry_amt
         self.user_agent = musicbrainz_construct_user_agent(arguments.email)
+        playlist_cache = PlaylistCache(PurePath(globals.CONTAINER_MUSIC_PATH, "ctl_playlist_cache"),
+                                       0 if arguments.refresh_playlists
+                                       else arguments.playlist_cache_ttl*3600)
         self.playlist_handler = PlaylistHandler(self.retries,
                                                 arguments.playlists,
                                                 self.playlists_info,
-                                                arguments.request_sleep)
-        self.lyric_handler = LyricHandler(arguments.genius_api_key,
-                                          verbosity=(True if logger.getEffectiveLevel() < logging.INFO else False))
+                                                arguments.request_sleep,
+                                                arguments.playlist_workers,
+                                                playlist_cache)
+        self.lyric_handler = LyricHandler(
+            arguments.genius_api_key,
+            verbosity=(True if logger.getEffectiveLevel() < logging.INFO else False),
+            cache_path=PurePath(globals.CONTAINER_MUSIC_PATH, "ctl_lyrics_cache"))
         self.report_fpath = PurePath(globals.CONTAINER_MUSIC_PATH, "ctl_report")
 
         if (os.path.exists(self.report_fpath)):
@@ -82,6 +106,10 @@ class CloudToLocal:
             logger.debug("No Existing Report, Creating New One...")
             self.report = {}
 
+        # Entries downloaded by an interrupted run that still need their metadata filled
+        self.journal = WorkJournal(PurePath(globals.CONTAINER_MUSIC_PATH, "ctl_journal"))
+        self.resumed_downloads = self.journal.restore(self.report)
+
         self.downloader = DownloadManager({
             "report": self.report,
             "retry_amt": arguments.retry_amt,
@@ -89,31 +117,173 @@ class CloudToLocal:
             "request_sleep": arguments.request_sleep,
             "playlist_handler": self.playlist_handler,
             "output_dir": globals.CONTAINER_MUSIC_PATH,
-            "download_sleep": arguments.download_sleep
+            "download_sleep": arguments.download_sleep,
+            "download_workers": arguments.download_workers,
+            "youtube_workers": arguments.youtube_workers,
+            "soundcloud_workers": arguments.soundcloud_workers,
+            "postprocess_workers": arguments.postprocess_workers,
+            "incremental": not arguments.full_sync,
+            "journal": self.journal
         })
 
+        self.reconcile_playlists = arguments.reconcile_playlists
+        self.stop_requested = False
+        self.exit_requested = False
         self.set_exit_handlers()
 
     def run_download_sequence(self):
-
-        for download_info in self.downloader.download_generator():
-            fill_report_metadata(self.user_agent,
-                                 self.lyric_handler,
-                                 title=download_info.title,
-                                 uploader=download_info.uploader,
-                                 provider=download_info.provider,
-                                 url=download_info.url,
-                                 report=self.report)
+        """ Run downloads and metadata lookups as two stages connected by a bounded queue so
+            that downloads continue while metadata is being searched for. """
+
+        if (self.reconcile_playlists):
+            self.playlist_handler.reconcile_playlists(
+                os.path.join(globals.CONTAINER_MUSIC_PATH, ""))
+
+        download_queue = queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+        download_stage = threading.Thread(target=self.download_stage,
+                                          args=(download_queue,),
+                                          name="ctl_download_stage",
+                                          daemon=True)
+        download_stage.start()
+        self.metadata_stage(download_queue)
+        if (self.exit_requested):
+            # Downloads that are still running are resumed from the journal by the next run
+            self.dump_report()
+            self.reset_exit_handlers()
+            logger.info("Exiting")
+            sys.exit(0)
+        download_stage.join()
+        self.downloader.close()
 
         clean_ytdlp_artifacts(globals.CONTAINER_MUSIC_PATH)
+        get_genre_registry().flush()
         self.dump_report()
         self.reset_exit_handlers()
+
+        if (self.stop_requested):
+            logger.info("Download stopped early, exiting")
+            sys.exit(0)
         logger.info("Download Completed")
 
+    def download_stage(self, download_queue: queue.Queue):
+        """ Producer of the download sequence. Sentinel of None marks the end of the downloads. """
+        try:
+            for download_info in self.resumed_downloads:
+                download_queue.put(download_info)
+            self.resumed_downloads = []
+
+            with contextlib.closing(self.downloader.download_generator()) as downloads:
+                for download_info in downloads:
+                    download_queue.put(download_info)
+        except Exception:
+            logger.error("Unexpected error in download stage", exc_info=True)
+        finally:
+            download_queue.put(None)
+
+    def metadata_stage(self, download_queue: queue.Queue):
+        """ Consumer of the download sequence. Fills metadata until the download stage is done.
+            Songs whose metadata providers are unavailable are retried with a backoff. Lyrics are
+            searched for in batches, whenever LYRICS_BATCH_SIZE songs are waiting or no download
+            is ready. """
+        deferred = RetryScheduler()
+        deferrals = {}
+        lyrics_pending = []
+        downloads_done = False
+        while ((not downloads_done) or deferred):
+            if (self.exit_requested):
+                break
+
+            if ((LYRICS_BATCH_SIZE <= len(lyrics_pending))
+                    or (lyrics_pending and (downloads_done or download_queue.empty()))):
+                self.fill_lyrics(lyrics_pending)
+                lyrics_pending = []
+
+            download_info = deferred.pop()
+            if (download_info is None):
+                ready_in = deferred.next_ready_in()
+                poll_interval = (STOP_POLL_INTERVAL if (ready_in is None)
+                                 else min(ready_in, STOP_POLL_INTERVAL))
+                if (not downloads_done):
+                    try:
+                        download_info = download_queue.get(timeout=poll_interval)
+                    except queue.Empty:
+                        continue
+                    if (download_info is None):
+                        downloads_done = True
+                        continue
+                elif (self.stop_requested):
+                    # Deferred songs stay in the journal and are resumed by the next run
+                    break
+                else:
+                    time.sleep(poll_interval)
+                    continue
+
+            try:
+                fill_report_metadata(self.user_agent,
+                                     None,
+                                     title=download_info.title,
+                                     uploader=download_info.uploader,
+                                     provider=download_info.provider,
+                                     url=download_info.url,
+                                     report=self.report)
+            except ProviderUnavailableError as error:
+                deferrals[download_info.url] = deferrals.get(download_info.url, 0) + 1
+                if (METADATA_MAX_DEFERRALS < deferrals[download_info.url]):
+                    logger.warning(f"{error}, leaving metadata of '{download_info.title}' to "
+                                   "the next run")
+                    continue
+                delay = max(error.retry_after, backoff_delay(deferrals[download_info.url]))
+                logger.info(f"{error}, retrying metadata of '{download_info.title}' in "
+                            f"{delay:.1f}s")
+                deferred.push(download_info, error.provider, delay)
+                continue
+            except Exception:
+                logger.error(f"Unexpected error filling metadata for '{download_info.title}'",
+                             exc_info=True)
+                continue
+            lyrics_pending.append(download_info.url)
+
+        if (not self.exit_requested):
+            self.fill_lyrics(lyrics_pending)
+
+    def fill_lyrics(self, urls: list):
+        """ Search for the lyrics of the songs whose metadata was filled concurrently and record
+            the songs as enriched. """
+        found = [url for url in urls if self.report[url].get("post", None)]
+        lyrics = self.lyric_handler.obtain_lyrics_batch(
+            [(self.report[url]["post"]["title"], self.report[url]["post"]["artist"])
+             for url in found])
+        for url, song_lyrics in zip(found, lyrics):
+            self.report[url]["post"]["lyrics"] = song_lyrics
+
+        # Every journal writer takes the report lock first
+        with self.downloader.report_lock:
+            self.journal.record_many(urls, JournalState.ENRICHED, report=self.report)
+
+    def drain_and_exit(self, sig_number, frame):
+        """ Stop scheduling downloads and let queued work finish before exiting. A second signal
+            exits without waiting for queued work. Only flags are set here, the report is dumped
+            by run_download_sequence as a signal can land while the report or journal is being
+            written. """
+        if (self.stop_requested):
+            logger.info("Exit requested, exiting once the report is written...")
+            self.exit_requested = True
+            return
+
+        logger.info("Stop requested, finishing queued work... (Send again to exit immediately)")
+        self.stop_requested = True
+        self.downloader.stop()
+
     def dump_report(self):
-        logger.info("Dumping Report")
-        with open(self.report_fpath, "w") as f:
-            json.dump(self.report, f, indent=2)
+        def write_report():
+            logger.info("Dumping Report")
+            with open(self.report_fpath, "w") as f:
+                json.dump(self.report, f, indent=2)
+
+        # Everything in the journal is in the report once it is written. Download workers keep
+        # adding to the report, the report lock is taken before the journal lock as they do
+        with self.downloader.report_lock:
+            self.journal.checkpoint(write_report)
 
     def dump_and_exit(self, sig_number, frame):
         self.dump_report()
@@ -124,8 +294,8 @@ class CloudToLocal:
         self.original_sigterm_handler = signal.getsignal(signal.SIGTERM)
 
         atexit.register(self.dump_and_exit, None, None)
-        signal.signal(signal.SIGINT, self.dump_and_exit)
-        signal.signal(signal.SIGTERM, self.dump_and_exit)
+        signal.signal(signal.SIGINT, self.drain_and_exit)
+        signal.signal(signal.SIGTERM, self.drain_and_exit)
 
     def reset_exit_handlers(self):
         atexit.unregister(self.dump_and_exit)
@@ -164,6 +334,7 @@ def main(arguments):
         arguments.host_outdir += '/'
 
     if (arguments.start_tui):
+        globals.THUMBNAIL_CACHE_PATH = arguments.host_outdir + "ctl_thumbnail_cache"
         logger.debug("Starting Tui")
         ctl_tui(arguments).run()
         exit()
@@ -176,6 +347,7 @@ def main(arguments):
 
     logging.debug(vars(arguments))
 
+    globals.THUMBNAIL_CACHE_PATH = PurePath(globals.CONTAINER_MUSIC_PATH, "ctl_thumbnail_cache")
     download_loop(arguments)
 
 
@@ -252,6 +424,58 @@ if __name__ == "__main__":
     parser.add_argument("--request_sleep", "-rs", default=1, type=int,
                         help="Amount Of Seconds To Sleep Between Requests")
 
+    parser.add_argument("--download_workers", type=int, default=1,
+                        help="Amount Of Entries To Download At Once")
+
+    parser.add_argument("--youtube_workers", type=int, default=None,
+                        help="Maximum Amount Of Youtube Entries To Download At Once. "
+                             "Defaults To --download_workers")
+
+    parser.add_argument("--soundcloud_workers", type=int, default=None,
+                        help="Maximum Amount Of Soundcloud Entries To Download At Once. "
+                             "Defaults To --download_workers")
+
+    parser.add_argument("--playlist_workers", type=int, default=4,
+                        help="Amount Of Playlists To Extract At Once")
+
+    parser.add_argument("--playlist_cache_ttl", type=float, default=1,
+                        help="Amount Of Hours That Extracted Playlists Are Reused For Before "
+                             "Being Extracted Again")
+
+    parser.add_argument("--refresh_playlists", action="store_true",
+                        help="Extract Every Playlist Again Instead Of Using The Playlist Cache")
+
+    parser.add_argument("--reconcile_playlists", action="store_true",
+                        help="Remove Songs From Playlist Files That Were Removed From Their "
+                             "Upstream Playlist")
+
+    parser.add_argument("--postprocess_workers", type=int, default=None,
+                        help="Amount Of Downloads To Postprocess (Transcode And Embed) At Once. "
+                             "Defaults To The Cpu Count")
+
+    parser.add_argument("--keep_source_codec", action="store_true",
+                        help="Keep Vorbis And AAC Downloads As .ogg And .m4a Files Instead Of "
+                             "Transcoding Them To Opus")
+
+    parser.add_argument("--cover_max_size", type=int, default=globals.COVER_MAX_SIZE,
+                        help="Maximum Width And Height In Pixels Of Embedded Covers. Larger Covers "
+                             "Are Downscaled And Re-encoded As JPEG. 0 (The Default) Embeds "
+                             "Covers As They Are Downloaded")
+
+    parser.add_argument("--cover_quality", type=int, default=globals.COVER_QUALITY,
+                        help="JPEG Quality (1-95) Of Re-encoded Covers")
+
+    parser.add_argument("--album_covers", choices=ALBUM_COVER_MODES, default=globals.ALBUM_COVERS,
+                        help="How Covers Of Albums Are Stored. 'embed' Embeds The Cover In Every "
+                             "Track, 'thumbnail' Writes One covers/<release mbid>/cover.jpg Per "
+                             "Album And Embeds A Small Thumbnail, 'none' Writes The Album Cover "
+                             "Without Embedding Anything. Tracks Are Tagged With Their Release "
+                             "mbid (MusicBrainz Album Id) To Find Their Album's Cover")
+
+    parser.add_argument("--full_sync", action="store_true",
+                        help="Check every playlist entry instead of only the entries added "
+                             "since the last sync")
+
     parser.add_argument("--fresh", "-f", action="store_true",
                         help="Bypass previous sleep records and Delete Directory Before           \
                         Downloading (Mainly For Testing)")
@@ -279,5 +503,9 @@ if __name__ == "__main__":
 
     globals.CONTAINER_MUSIC_PATH = os.environ.get("CONTAINER_OUTDIR", None)
     globals.ENABLE_YTDLP_LOG = args.log_ytdlp
+    globals.KEEP_SOURCE_CODEC = args.keep_source_codec
+    globals.COVER_MAX_SIZE = args.cover_max_size
+    globals.COVER_QUALITY = args.cover_quality
+    globals.ALBUM_COVERS = args.album_covers
     globals.PROJECT_ROOT_DIR = os.path.abspath(__file__)
     main(args)
@@ -30,21 +30,81 @@
 #
 #################################################################################
 
+import os
 import logging
+import threading
 from time import sleep
-from dataclasses import asdict
+from dataclasses import asdict, dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import globals
-from yt_dlp import YoutubeDL
 from report import ReportStatus
-from utils.common import DownloadInfo
+from journal import JournalState
 from utils.ctl_logging import tui_log
 from yt_dlp.utils import DownloadError
+from playlists import PlaylistSnapshots
+from postprocess import PostProcessPool
+from ytdl_session import YoutubeDLSession
+from utils.rate_limit import rate_limit_url
 from report import add_to_report_pre_search
 from metadata import handle_genre, get_embedded_thumbnail_res
+from utils.common import DownloadInfo, Providers, entry_archive_id
+from utils.retry import RetryScheduler, BREAKER_COOLDOWN, backoff_delay, get_breaker
 
 logger = logging.getLogger(__name__)
 
+# Seconds a provider may stay paused by its circuit breaker before its remaining entries are
+# reported as failed and left to the next run
+DOWNLOAD_MAX_BREAKER_OPEN = 6 * BREAKER_COOLDOWN
+
+
+@dataclass
+class DownloadTask:
+    """ Playlist entry scheduled for download and the state carried between its attempts. """
+    index: int
+    total: int
+    entry: dict
+    attempts: int = 0
+    genres: list[str] = None
+    thumbnail_url: str = None
+    resolved_info: dict = None
+    download_info: DownloadInfo = None
+    # Info dict of the raw download that is handed to the postprocessors
+    downloaded_info: dict = None
+
+    @property
+    def provider(self) -> str:
+        return (self.entry.get("ie_key", None))
+
+
+def written_thumbnail_res(info: dict) -> tuple:
+    """ Resolution yt-dlp reported for the thumbnail it wrote, and so embedded, None if unknown or
+        if the thumbnail was downscaled before being embedded. """
+    for thumbnail in (info or {}).get("thumbnails", None) or []:
+        if (thumbnail.get("filepath", None)
+                and thumbnail.get("width", None) and thumbnail.get("height", None)):
+            if (globals.COVER_MAX_SIZE
+                    and (globals.COVER_MAX_SIZE < max(thumbnail["width"], thumbnail["height"]))):
+                return None
+            return ((thumbnail["width"], thumbnail["height"]))
+    return None
+
+
+def is_expected_error(error: DownloadError) -> bool:
+    """ Whether a download error is specific to the entry (ex. unavailable or private video)
+        rather than a sign of the provider having problems. """
+    cause = error.exc_info[1] if error.exc_info else None
+    return (bool(getattr(cause, "expected", False)))
+
+
+def load_download_archive(path: str) -> set:
+    """ Load the yt-dlp download archive into a set of '<extractor> <id>' strings. """
+    if (not (path and os.path.exists(path))):
+        return set()
+
+    with open(path, "r") as fptr:
+        return ({line.strip() for line in fptr if line.strip()})
+
 
 class DownloadManager:
 
@@ -99,7 +159,9 @@ class DownloadManager:
     }
 
     VALID_SETTING_KEYS = ["playlists_info", "output_dir", "download_sleep", "request_sleep",
-                          "retry_amt", "report", "playlist_handler"]
+                          "retry_amt", "report", "playlist_handler", "download_workers",
+                          "youtube_workers", "soundcloud_workers", "incremental", "journal",
+                          "postprocess_workers"]
     REQUIRED_SETTING_KEYS = ["playlist_info", "output_dir", "report", "playlist_handler"]
 
     def __init__(self, settings_obj: dict):
@@ -111,62 +173,106 @@ class DownloadManager:
                 raise Exception(f"Invalid Download Manager Setting: {key}")
 
         self.retry_amt = getattr(self, "retry_amt", 0)
+        self.download_workers = max(1, getattr(self, "download_workers", 1) or 1)
+        self.youtube_workers = getattr(self, "youtube_workers", None)
+        self.soundcloud_workers = getattr(self, "soundcloud_workers", None)
+        self.snapshots = PlaylistSnapshots() if getattr(self, "incremental", False) else None
+        self.journal = getattr(self, "journal", None)
+        # Guards the report as entries can be written to it from multiple download workers.
+        # Reentrant as the report is also dumped from signal handlers of the main thread
+        self.report_lock = threading.RLock()
+        self.stop_event = threading.Event()
         self.YDL_OPTS_DOWNLOAD["paths"] = {"home": self.output_dir}
         self.YDL_OPTS_DOWNLOAD["download_archive"] = self.output_dir+"/archive"
         self.YDL_OPTS_DOWNLOAD["max_sleep_interval"] = self.download_sleep or 0
         self.YDL_OPTS_DOWNLOAD["sleep_interval_requests"] = self.request_sleep or 0
 
+        # NOTE: yt-dlp only consults the archive after an entry has been resolved, so it is kept
+        #       in memory to skip entries before any request is made. The download session has
+        #       no archive file of its own, entries are added to this set and the archive file
+        #       by _record_archive once they have been postprocessed.
+        self.archive_index = load_download_archive(self.YDL_OPTS_DOWNLOAD["download_archive"])
+        self.archive_lock = threading.Lock()
+        # Playlist entries are downloaded without postprocessing, which runs on the process pool
+        # instead
+        self.download_session = YoutubeDLSession(self.YDL_OPTS_DOWNLOAD |
+                                                 {"postprocessors": [], "download_archive": None},
+                                                 archive=self.archive_index)
+        self.postprocess_pool = PostProcessPool(self.YDL_OPTS_DOWNLOAD |
+                                                {"download_archive": None},
+                                                getattr(self, "postprocess_workers", None))
+        # Single downloads are explicitly requested so they should bypass the archive
+        self.single_download_session = YoutubeDLSession(self.YDL_OPTS_DOWNLOAD |
+                                                        {"download_archive": None})
+
+    def close(self):
+        """ Close all YoutubeDL sessions and worker processes held by the manager. """
+        self.download_session.close()
+        self.single_download_session.close()
+        self.postprocess_pool.close()
+
+    def _record_archive(self, archive_id: str):
+        """ Record an entry in the download archive in the same format as yt-dlp. """
+        with self.archive_lock:
+            with open(self.YDL_OPTS_DOWNLOAD["download_archive"], "a") as fptr:
+                fptr.write(archive_id + "\n")
+            self.archive_index.add(archive_id)
+
+    def _extract_download(self, ydl, url: str, resolved_info: dict = None) -> dict:
+        """ Download 'url'. When 'resolved_info' from a previous extraction is given it is
+            downloaded directly instead of extracting the url again. """
+        rate_limit_url(url)
+        if (resolved_info):
+            return (ydl.process_ie_result(resolved_info, download=True))
+        return (ydl.extract_info(url, download=True))
+
     def download_from_url(self, url) -> DownloadInfo:
         """Download singular song without managing any metadata. """
         if (not url):
             return False
         download_info = DownloadInfo()
-        single_dl_opts = self.YDL_OPTS_DOWNLOAD
-        single_dl_opts["download_archive"] = None
-        info = YoutubeDL(self.YDL_OPTS_DOWNLOAD).extract_info(url, download=False)
+        # Fully resolved info is reused for the download so the url is only extracted once
+        rate_limit_url(url)
+        resolved_info = self.single_download_session.get().extract_info(url, download=False)
         download_info.url = url
-        download_info.provider = info["extractor_key"]
+        download_info.provider = resolved_info["extractor_key"]
+        download_info.title = resolved_info["title"]
         if ("Youtube" == download_info.provider):
-            download_info.title = info["title"]
-            download_info.uploader = info["uploader"]
+            download_info.uploader = resolved_info["uploader"]
         else:
-            # NOTE: Soundcloud API Gives References To Song Instead
-            #       Of Song Information For Top Level Entry So We Must
-            #       Query Further ~ BEF
-            sc_info = YoutubeDL({'simulate': True,
-                                 'quiet': not globals.ENABLE_YTDLP_LOG,
-                                 'verbose': globals.ENABLE_YTDLP_LOG}
-                                ).extract_info(download_info.url)
-
-            download_info.title = sc_info["title"]
-            download_info.uploader = sc_info[
-                "artist"] if "artist" in sc_info else sc_info["uploader"]
+            download_info.uploader = resolved_info[
+                "artist"] if "artist" in resolved_info else resolved_info["uploader"]
 
         tui_log(f"Attempting to download: {download_info.title}")
 
+        # Single downloads are explicitly requested and retried in place, so they neither wait on
+        # nor count towards the circuit breaker of the provider
         attempts = 0
         while (True):
             if (not (self.retry_amt == attempts-1)):
                 try:
-                    with YoutubeDL(self.YDL_OPTS_DOWNLOAD) as ydl:
-                        video_info = ydl.extract_info(download_info.url, download=True)
-                        if ((video_info) and ("requested_downloads" in video_info)):
-                            video_dl_info = video_info["requested_downloads"][0]
-                            tui_log(f"Download to: {video_dl_info["filepath"]=}")
-                            download_info.src_path = video_dl_info["filepath"]
-                            download_info.short_path = download_info.src_path.removeprefix(
-                                self.host_outdir)
-                            if (download_info.short_path.startswith('/')):
-                                download_info.short_path = download_info.short_path[1:]
-                            download_info.duration = int(round(float(video_info["duration"]),
-                                                               0))
-                        else:
-                            tui_log("Video is already present in the archive.")
-                            break
+                    ydl = self.single_download_session.get()
+                    video_info = self._extract_download(ydl, download_info.url, resolved_info)
+                    if ((video_info) and ("requested_downloads" in video_info)):
+                        video_dl_info = video_info["requested_downloads"][0]
+                        tui_log(f"Download to: {video_dl_info["filepath"]=}")
+                        download_info.src_path = video_dl_info["filepath"]
+                        download_info.short_path = download_info.src_path.removeprefix(
+                            self.host_outdir)
+                        if (download_info.short_path.startswith('/')):
+                            download_info.short_path = download_info.short_path[1:]
+                        download_info.duration = int(round(float(video_info["duration"]),
+                                                           0))
+                    else:
+                        tui_log("Video is already present in the archive.")
+                        break
                     break
                 except DownloadError:
-                    tui_log(f"(#{attempts+1}) Failed to download... Retrying")
-                    sleep(attempts*10)
+                    delay = backoff_delay(attempts+1)
+                    tui_log(f"(#{attempts+1}) Failed to download... Retrying in {delay:.1f}s")
+                    # Stream urls of the resolved info may have expired
+                    resolved_info = None
+                    sleep(delay)
                 except Exception:
                     tui_log(f"Unexpected error for '{download_info.title}'")
             else:
@@ -177,89 +283,299 @@ class DownloadManager:
             return download_info
         return None
 
-    def download_generator(self) -> DownloadInfo:
+    def stop(self):
+        """ Stop scheduling new entries. Entries that are already downloading will finish. """
+        self.stop_event.set()
+
+    def _entry_provider_cap(self, provider: str) -> int:
+        """ Maximum amount of entries from 'provider' allowed to download at once. """
+        cap = {Providers.YT: self.youtube_workers,
+               Providers.SC: self.soundcloud_workers}.get(provider, None)
+        return (min(cap or self.download_workers, self.download_workers))
+
+    def _attempt_download(self, task: DownloadTask) -> DownloadInfo:
+        """ Make a single download attempt of a task. The downloaded file is not postprocessed.
+
+            Returns:
+                DownloadInfo of the downloaded entry or None if there is nothing to download
+
+            Raises:
+                DownloadError or any unexpected exception when the attempt failed
+        """
+
+        entry = task.entry
+        if (task.download_info is None):
+            download_info = DownloadInfo()
+            download_info.url = entry["url"]
+            if not download_info.url:
+                logger.warning(f"[{task.index+1}] Skipping: No URL found for {entry['title']}")
+                return None
+
+            download_info.provider = entry["ie_key"]
+            if ("Youtube" == download_info.provider):
+                download_info.title = entry["title"]
+                download_info.uploader = entry["uploader"]
+                task.thumbnail_url = entry["thumbnails"][len(entry["thumbnails"])-1]["url"]
+            else:
+                # NOTE: Soundcloud API Gives References To Song Instead
+                #       Of Song Information For Top Level Entry So We Must
+                #       Query Further ~ BEF
+                # The resolved info is kept and handed to the download so the track is only
+                # extracted once
+                rate_limit_url(download_info.url)
+                task.resolved_info = self.download_session.get().extract_info(download_info.url,
+                                                                              download=False)
+                if (not task.resolved_info):
+                    logger.info("Skipping...Song already present in the archive")
+                    return None
+
+                download_info.title = task.resolved_info["title"]
+                task.genres = handle_genre(task.resolved_info["genres"])
+                task.thumbnail_url = task.resolved_info["thumbnail"]
+                download_info.uploader = task.resolved_info[
+                    "artist"] if "artist" in task.resolved_info else task.resolved_info["uploader"]
+
+            task.download_info = download_info
+            logger.info(f"[{task.index+1}/{task.total}] Attempting: {download_info.title}")
+
+        download_info = task.download_info
+        ydl = self.download_session.get()
+        video_info = self._extract_download(ydl, download_info.url, task.resolved_info)
+        if (not ((video_info) and ("requested_downloads" in video_info))):
+            # Video is present in the archive ~ BEF
+            logger.info("Skipping...Song already present in the archive")
+            return None
+
+        # NOTE: yt-dlp strips the fields shared with the video info from the requested
+        #       downloads so they have to be merged back for the postprocessors
+        task.downloaded_info = video_info | video_info["requested_downloads"][0]
+        task.downloaded_info.pop("requested_downloads")
+        download_info.src_path = task.downloaded_info["filepath"]
+        download_info.duration = int(round(float(video_info["duration"]), 0))
+        return download_info
+
+    def _finish_download(self, task: DownloadTask, filepath: str) -> DownloadInfo:
+        """ Report and archive a task whose download has been postprocessed into 'filepath'. """
+
+        download_info = task.download_info
+        download_info.src_path = filepath
+        download_info.short_path = download_info.src_path.removeprefix(
+            globals.CONTAINER_MUSIC_PATH)
+        if (download_info.short_path.startswith('/')):
+            download_info.short_path = download_info.short_path[1:]
+
+        try:
+            thumbnail_width, thumbnail_height = (
+                written_thumbnail_res(task.downloaded_info)
+                or get_embedded_thumbnail_res(download_info.src_path))
+        except Exception:
+            logger.warning(f"Unable to read embedded thumbnail of {download_info.src_path}",
+                           exc_info=True)
+            thumbnail_width, thumbnail_height = (None, None)
+
+        with self.report_lock:
+            add_to_report_pre_search(
+                asdict(download_info) |
+                {
+                    "playlists": self.playlist_handler.check_playlists(download_info.url),
+                    "genres": task.genres,
+                    "thumbnail_url": task.thumbnail_url,
+                    "thumbnail_width": thumbnail_width,
+                    "thumbnail_height": thumbnail_height
+                },
+                self.report,
+                download_info.url,
+                ReportStatus.DOWNLOAD_SUCCESS)
+            if (self.journal):
+                self.journal.record(download_info.url, JournalState.DOWNLOADED,
+                                    report=self.report, download_info=download_info)
+
+        # Archived only once the journal has the entry, archived entries are never downloaded
+        # again so a crash in between must not leave one that nothing knows to tag
+        archive_id = entry_archive_id(task.downloaded_info) or entry_archive_id(task.entry)
+        if (archive_id):
+            self._record_archive(archive_id)
+        return download_info
 
+    def _handle_failed_attempt(self, task: DownloadTask, error: Exception,
+                               scheduler: RetryScheduler):
+        """ Reschedule a failed task with a backoff or report it once it is out of retries. """
+
+        task.attempts += 1
+        # Stream urls of the resolved info may have expired
+        task.resolved_info = None
+        title = task.download_info.title if task.download_info else task.entry.get("url", None)
+
+        breaker = get_breaker(task.provider)
+        if (isinstance(error, DownloadError)):
+            if (is_expected_error(error)):
+                # The provider answered, the entry itself is unavailable
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        else:
+            logger.error(f"Unexpected error for '{title}'", exc_info=error)
+            # Says nothing about the provider, but a trial request must not stay claimed
+            breaker.release_trial()
+
+        if (self.retry_amt < task.attempts):
+            logger.warning(f"Failed to download '{title}' after {task.attempts} attempts")
+            self._report_failure(task)
+            return
+
+        delay = backoff_delay(task.attempts)
+        logger.info(f"(#{task.attempts}) Failed to download '{title}'... Retrying in {delay:.1f}s")
+        scheduler.push(task, task.provider, delay)
+
+    def _report_failure(self, task: DownloadTask):
+        with self.report_lock:
+            add_to_report_pre_search({"url": task.entry["url"]},
+                                     self.report,
+                                     task.entry["url"],
+                                     ReportStatus.DOWNLOAD_FAILURE)
+
+    def _abandon_unavailable_providers(self, scheduler: RetryScheduler):
+        """ Report the scheduled tasks of providers that have been paused for longer than
+            DOWNLOAD_MAX_BREAKER_OPEN as failed so they don't hold up the run. """
+        for provider in scheduler.keys():
+            if (get_breaker(provider).open_for() <= DOWNLOAD_MAX_BREAKER_OPEN):
+                continue
+            tasks = scheduler.drain(provider)
+            logger.warning(f"{provider} has been unavailable for over "
+                           f"{DOWNLOAD_MAX_BREAKER_OPEN}s, leaving {len(tasks)} entries to the "
+                           "next run")
+            for task in tasks:
+                self._report_failure(task)
+
+    def _entry_generator(self):
+        """ Yields (index, playlist length, entry) for every playlist entry that still needs to be
+            downloaded. Entries already in the archive or already yielded for another playlist are
+            skipped without making any requests. """
+
+        scheduled = set()
         for curr_playlist_info in self.playlists_info:
+            archived_count = 0
+            total = len(curr_playlist_info["entries"])
+
+            synced_ids = set()
+            if (self.snapshots):
+                synced_ids = self.snapshots.get_entry_ids(curr_playlist_info)
+                new_ids, removed_ids = self.snapshots.diff(curr_playlist_info)
+                logger.info(f"{curr_playlist_info.get('title', None)}: {len(new_ids)} new and "
+                            f"{len(removed_ids)} removed entries since the last sync")
+                if (removed_ids):
+                    logger.info(f"Removed entries: {sorted(removed_ids)}")
+
             for index, entry in enumerate(curr_playlist_info["entries"]):
-                download_info = DownloadInfo()
-                download_info.url = entry["url"]
-                if not download_info.url:
-                    logger.warning(f"[{index+1}] Skipping: No URL found for {entry['title']}")
-                    continue
-
-                download_info.provider = entry["ie_key"]
-                if ("Youtube" == download_info.provider):
-                    genres = None
-                    download_info.title = entry["title"]
-                    download_info.uploader = entry["uploader"]
-                    thumbnail_url = entry["thumbnails"][len(entry["thumbnails"])-1]["url"]
-                else:
-                    # NOTE: Soundcloud API Gives References To Song Instead
-                    #       Of Song Information For Top Level Entry So We Must
-                    #       Query Further ~ BEF
-                    sc_info = YoutubeDL({'simulate': True,
-                                         'quiet': not globals.ENABLE_YTDLP_LOG,
-                                         'verbose': globals.ENABLE_YTDLP_LOG}
-                                        ).extract_info(download_info.url)
-
-                    download_info.title = sc_info["title"]
-                    genres = handle_genre(sc_info["genres"])
-                    thumbnail_url = sc_info["thumbnail"]
-                    download_info.uploader = sc_info[
-                        "artist"] if "artist" in sc_info else sc_info["uploader"]
-
-                logger.info(f"[{index+1}/{len(curr_playlist_info['entries'])}] Attempting: {
-                    download_info.title}")
-
-                attempts = 0
-                while (True):
-                    if (not (self.retry_amt == attempts-1)):
-                        try:
-                            with YoutubeDL(self.YDL_OPTS_DOWNLOAD) as ydl:
-                                video_info = ydl.extract_info(download_info.url, download=True)
-                                if ((video_info) and ("requested_downloads" in video_info)):
-                                    video_dl_info = video_info["requested_downloads"][0]
-                                    download_info.src_path = video_dl_info["filepath"]
-                                    download_info.short_path = download_info.src_path.removeprefix(
-                                        globals.CONTAINER_MUSIC_PATH)
-                                    if (download_info.short_path.startswith('/')):
-                                        download_info.short_path = download_info.short_path[1:]
-                                    duration = int(round(float(video_info["duration"]), 0))
-                                else:
-                                    # Video is present in the archive ~ BEF
-                                    logger.info("Skipping...Song already present in the archive")
-                                    break
+                archive_id = entry_archive_id(entry)
+                if (archive_id):
+                    if ((archive_id in synced_ids)
+                            or (archive_id in self.archive_index)
+                            or (archive_id in scheduled)):
+                        archived_count += 1
+                        continue
+                    scheduled.add(archive_id)
+                yield (index, total, entry)
+
+            if (archived_count):
+                logger.info(f"Skipped {archived_count}/{total} entries of "
+                            f"{curr_playlist_info.get('title', None)} that are already synced, "
+                            "archived or scheduled")
+
+    def _download_pool_generator(self) -> DownloadInfo:
+        """ Download entries on the worker pool while respecting the per provider worker caps and
+            circuit breakers. Failed entries are retried later without holding up other entries.
+            Downloaded files are handed to the postprocess pool so the download workers can move
+            on to the next entry. Results are yielded in the order that they complete. """
+
+        scheduler = RetryScheduler()
+        queued_urls = []
+        for index, total, entry in self._entry_generator():
+            task = DownloadTask(index, total, entry)
+            scheduler.push(task, task.provider)
+            queued_urls.append(entry["url"])
+        if (self.journal):
+            self.journal.record_many(queued_urls, JournalState.QUEUED)
+
+        in_flight = {}
+        postprocessing = {}
+        provider_counts = {}
+
+        def provider_available(provider):
+            return ((provider_counts.get(provider, 0) < self._entry_provider_cap(provider))
+                    and get_breaker(provider).available())
+
+        with ThreadPoolExecutor(max_workers=self.download_workers,
+                                thread_name_prefix="ctl_download") as executor:
+            try:
+                while (scheduler or in_flight or postprocessing):
+                    if (self.stop_event.is_set()):
+                        scheduler.clear()
+                    self._abandon_unavailable_providers(scheduler)
+
+                    while (len(in_flight) < self.download_workers):
+                        task = scheduler.pop(provider_available)
+                        if (task is None):
                             break
-                        except DownloadError:
-                            logger.info(f"(#{attempts+1}) Failed to download... Retrying")
-                            sleep(attempts*10)
-                        except Exception:
-                            logger.error(f"Unexpected error for '{download_info.title}'",
-                                         exc_info=True)
-                    else:
-                        add_to_report_pre_search({"url": download_info.url},
-                                                 self.report,
-                                                 download_info.url,
-                                                 ReportStatus.DOWNLOAD_FAILURE)
-                        break
-                    attempts += 1
-
-                if (download_info.src_path):
-                    thumb_dimensions = get_embedded_thumbnail_res(download_info.src_path)
-                    thumbnail_width = thumb_dimensions[0]
-                    thumbnail_height = thumb_dimensions[1]
-                    add_to_report_pre_search(
-                        asdict(download_info) |
-                        {
-                            "playlists": self.playlist_handler.check_playlists(download_info.url),
-                            "genres": genres,
-                            "duration": duration,
-                            "thumbnail_url": thumbnail_url,
-                            "thumbnail_width": thumbnail_width,
-                            "thumbnail_height": thumbnail_height
-                        },
-                        self.report,
-                        download_info.url,
-                        ReportStatus.DOWNLOAD_SUCCESS)
-                    yield (download_info)
+                        get_breaker(task.provider).allow()
+                        in_flight[executor.submit(self._attempt_download, task)] = task
+                        provider_counts[task.provider] = provider_counts.get(task.provider, 0) + 1
+
+                    # Wake up for whichever comes first, a delayed retry or a paused provider
+                    timeouts = [get_breaker(provider).retry_after()
+                                for provider in scheduler.ready_keys()]
+                    timeouts.append(scheduler.next_ready_in())
+                    timeouts = [timeout for timeout in timeouts if timeout]
+                    timeout = min(timeouts) if timeouts else None
+
+                    if (not (in_flight or postprocessing)):
+                        self.stop_event.wait(timeout if timeout else 1)
+                        continue
+
+                    done, _ = wait(list(in_flight) + list(postprocessing), timeout=timeout,
+                                   return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if (future in postprocessing):
+                            task = postprocessing.pop(future)
+                            try:
+                                download_info = self._finish_download(task, future.result())
+                            except Exception as error:
+                                self._handle_failed_attempt(task, error, scheduler)
+                                continue
+                            yield (download_info)
+                            continue
+
+                        task = in_flight.pop(future)
+                        provider_counts[task.provider] -= 1
+                        try:
+                            download_info = future.result()
+                        except Exception as error:
+                            self._handle_failed_attempt(task, error, scheduler)
+                            continue
+
+                        get_breaker(task.provider).record_success()
+                        if (download_info):
+                            pp_future = self.postprocess_pool.submit(download_info.src_path,
+                                                                     task.downloaded_info)
+                            postprocessing[pp_future] = task
+            finally:
+                for future in (list(in_flight) + list(postprocessing)):
+                    future.cancel()
+
+    def _save_snapshots(self):
+        """ Record every entry that was archived so the next sync can skip it. Entries that failed
+            are left out of the snapshot so they are retried on the next sync. """
+        if (not self.snapshots):
+            return
+
+        for curr_playlist_info in self.playlists_info:
+            self.snapshots.update(curr_playlist_info, self.archive_index)
+        self.snapshots.save()
+
+    def download_generator(self) -> DownloadInfo:
+
+        try:
+            yield from self._download_pool_generator()
+        finally:
+            self._save_snapshots()
         return
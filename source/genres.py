@@ -0,0 +1,206 @@
+###
+#  @file    genres.py
+#
+#  @brief   Registry of known genres
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import os
+import re
+import json
+import atexit
+import logging
+import threading
+from collections import Counter
+
+import globals
+
+logger = logging.getLogger(__name__)
+
+# Minimum similarity (dice coefficient of trigrams) for a genre to be matched to a known genre
+GENRE_MATCH_THRESHOLD = 0.8
+
+# Normalized spellings of known genres that normalization alone can't catch
+GENRE_ALIASES = {
+    "dnb": "drum and bass",
+    "d and b": "drum and bass",
+    "rnb": "r&b",
+    "r and b": "r&b",
+    "rhythm and blues": "r&b",
+    "electronic dance music": "edm",
+}
+
+
+def normalize_genre(genre: str) -> str:
+    """ Normalize a genre for matching. ex. "Drum 'n' Bass" -> "drum and bass" """
+    genre = genre.lower()
+    genre = re.sub(r"'n'|\s*[&+]\s*", " and ", genre)
+    genre = re.sub(r"(?:^|\s)n(?:\s|$)", " and ", genre)
+    genre = re.sub(r"[^\w\s]+", " ", genre)
+    return (" ".join(genre.split()))
+
+
+def _compact(normalized: str) -> str:
+    # Spacing doesn't matter, ex. "lo fi" and "lofi"
+    return (normalized.replace(" ", ""))
+
+
+def _trigrams(compact: str) -> set:
+    padded = f"  {compact} "
+    return ({padded[i:i+3] for i in range(len(padded) - 2)})
+
+
+class GenreRegistry:
+    """ Known genres loaded from the genre file once and shared by everything in the process.
+        Newly learned genres are kept in memory and written to the genre file by flush. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        with open(self.path, "r") as fptr:
+            self._genres = json.load(fptr)
+        self._genre_set = set()
+        self._new_genres = []
+
+        # Compact normalized genre -> known genre and
+        # trigram -> {length: compact normalized genres of that length}
+        self._compact_index = {}
+        self._trigram_index = {}
+        # Results of previous matches, cleared when a genre is added
+        self._match_cache = {}
+        for genre in self._genres:
+            self._index(genre)
+
+    def _index(self, genre: str):
+        self._genre_set.add(genre)
+        compact = _compact(normalize_genre(genre))
+        if (compact in self._compact_index):
+            return
+        self._compact_index[compact] = genre
+        self._match_cache.clear()
+        for trigram in _trigrams(compact):
+            self._trigram_index.setdefault(trigram, {}).setdefault(len(compact), []).append(
+                compact)
+
+    def match(self, genre: str) -> str:
+        """ Get the known genre that 'genre' is a spelling of. None if there is no close enough
+            match. """
+        if (genre in self._genre_set):
+            return (genre)
+
+        normalized = normalize_genre(genre)
+        if (normalized in GENRE_ALIASES):
+            normalized = normalize_genre(GENRE_ALIASES[normalized])
+        compact = _compact(normalized)
+        with self.lock:
+            known = self._compact_index.get(compact, None)
+            if (known or (not compact)):
+                return (known)
+            if (compact in self._match_cache):
+                return (self._match_cache[compact])
+
+            known = self._fuzzy_match(compact)
+            self._match_cache[compact] = known
+        if (known):
+            logger.debug(f"Matched genre {genre} to {known}")
+        return (known)
+
+    def _fuzzy_match(self, compact: str) -> str:
+        """ Get the known genre with the most trigrams in common with 'compact' if it is similar
+            enough. """
+        trigrams = _trigrams(compact)
+        # A compact genre of length n has n + 1 padded trigrams. Genres with too many more or
+        # less trigrams can't reach the threshold so they aren't considered at all.
+        min_length = int(len(trigrams) * GENRE_MATCH_THRESHOLD / (2 - GENRE_MATCH_THRESHOLD)) - 1
+        max_length = int(len(trigrams) * (2 - GENRE_MATCH_THRESHOLD) / GENRE_MATCH_THRESHOLD)
+        shared = Counter()
+        for trigram in trigrams:
+            postings = self._trigram_index.get(trigram, {})
+            for length in range(max(1, min_length), max_length + 1):
+                shared.update(postings.get(length, ()))
+
+        best_score, best_match = 0, None
+        for candidate, count in shared.items():
+            score = 2 * count / (len(trigrams) + len(candidate) + 1)
+            if (best_score < score):
+                best_score, best_match = score, candidate
+
+        if (GENRE_MATCH_THRESHOLD <= best_score):
+            return (self._compact_index[best_match])
+        return None
+
+    def __contains__(self, genre: str) -> bool:
+        return (genre in self._genre_set)
+
+    def __len__(self):
+        return (len(self._genres))
+
+    def genres(self) -> list[str]:
+        """ Get every known genre in the order of the genre file. """
+        with self.lock:
+            return (list(self._genres))
+
+    def add(self, genre: str) -> bool:
+        """ Add a genre. Returns whether the genre was new. """
+        with self.lock:
+            if (genre in self._genre_set):
+                return False
+            self._genres.append(genre)
+            self._new_genres.append(genre)
+            self._index(genre)
+            return True
+
+    def flush(self):
+        """ Write the genre file if any genres were learned since the last flush. """
+        with self.lock:
+            if (not self._new_genres):
+                return
+
+            logger.info(f"Adding {len(self._new_genres)} new genres to the genre list")
+            # Written to a temporary file first so a killed run can't leave a partial file behind
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w") as fptr:
+                    json.dump(self._genres, fptr)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                logger.error(f"Unable to write genre file {self.path}", exc_info=True)
+                return
+            self._new_genres = []
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_genre_registry() -> GenreRegistry:
+    """ Get the genre registry of the process, loading it on first use. """
+    global _registry
+    with _registry_lock:
+        if (_registry is None):
+            _registry = GenreRegistry(globals.GENRE_PATH)
+            atexit.register(_registry.flush)
+        return (_registry)
@@ -35,8 +35,17 @@ import pathlib
 CTLDL_VERSION = "1.0.0"
 ENABLE_YTDLP_LOG = False
 REQUEST_RESOLUTION = 1200
+# Longest side in pixels and JPEG quality that embedded covers are normalized to, covers are
+# embedded as they are downloaded (up to REQUEST_RESOLUTION) when the size is 0
+COVER_MAX_SIZE = 0
+COVER_QUALITY = 85
+# Whether vorbis and aac downloads are kept as .ogg and .m4a instead of being transcoded to opus
+KEEP_SOURCE_CODEC = False
+# How covers of albums found on MusicBrainz are stored, one of covers.ALBUM_COVER_MODES
+ALBUM_COVERS = "embed"
 SHELF_NAME = "ctldl_shelf"
 CONTAINER_MUSIC_PATH = None
+THUMBNAIL_CACHE_PATH = None
 MUSICBRAINZ_USER_AGENT = None
 PROJECT_ROOT_DIR = pathlib.Path(__file__).parents[1]
 GENRE_PATH = pathlib.Path(PROJECT_ROOT_DIR, "genres.json")
@@ -0,0 +1,168 @@
+###
+#  @file    journal.py
+#
+#  @brief   Append only journal of the work done by a download run
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import os
+import json
+import logging
+import threading
+from dataclasses import asdict
+
+from utils.common import DownloadInfo
+
+logger = logging.getLogger(__name__)
+
+
+class JournalState:
+    QUEUED = "queued"
+    DOWNLOADED = "downloaded"
+    ENRICHED = "enriched"
+    TAGGED = "tagged"
+
+
+class WorkJournal:
+    """ Append only record of the state transitions of every entry of a run. Every record is
+        flushed to disk before returning so a killed run can be resumed from the journal.
+
+        Records are json lines of:
+            {"url": str, "state": JournalState, "report": report entry, "download_info": dict}
+        where "report" and "download_info" are only present when the state has them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self._drop_torn_record()
+
+    def _drop_torn_record(self):
+        """ Cut off a record that was only partially written when the previous run was killed so
+            that new records don't get appended onto it. """
+        if (not os.path.exists(self.path)):
+            return
+
+        with open(self.path, "rb+") as fptr:
+            content = fptr.read()
+            if ((not content) or content.endswith(b"\n")):
+                return
+            logger.warning("Dropping partially written journal record")
+            fptr.truncate(content.rfind(b"\n") + 1)
+
+    def _write(self, records: list):
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with self.lock, open(self.path, "a") as fptr:
+            fptr.write(lines)
+            fptr.flush()
+            os.fsync(fptr.fileno())
+
+    def record(self, url: str, state: str, report: dict = None, download_info: DownloadInfo = None):
+        """ Record that the entry of 'url' reached 'state'. """
+        self.record_many([url], state, report, download_info)
+
+    def record_many(self, urls: list, state: str, report: dict = None,
+                    download_info: DownloadInfo = None):
+        """ Record a state for several entries with a single write to disk. """
+        records = []
+        for url in urls:
+            record = {"url": url, "state": state}
+            if (report is not None):
+                record["report"] = report.get(url, None)
+            if (download_info is not None):
+                record["download_info"] = asdict(download_info)
+            records.append(record)
+
+        if (records):
+            self._write(records)
+
+    def load(self) -> dict:
+        """ Get the latest record of every url in the journal. """
+        latest = {}
+        if (not os.path.exists(self.path)):
+            return (latest)
+
+        with open(self.path, "r") as fptr:
+            for line_num, line in enumerate(fptr, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring corrupt journal record on line {line_num}")
+                    continue
+
+                previous = latest.get(record["url"], {})
+                # Keep the last known report of an entry when later records don't carry one
+                latest[record["url"]] = {
+                    "report": previous.get("report", None),
+                    "download_info": previous.get("download_info", None)
+                } | record
+        return (latest)
+
+    def restore(self, report: dict) -> list[DownloadInfo]:
+        """ Apply the journal on top of a report loaded from disk.
+
+            Returns:
+                DownloadInfo of the entries that were downloaded but never enriched with metadata
+        """
+        pending = []
+        for url, record in self.load().items():
+            if (JournalState.TAGGED == record["state"]):
+                report.pop(url, None)
+                continue
+
+            if (record["report"]):
+                report[url] = record["report"]
+            if ((JournalState.DOWNLOADED == record["state"]) and (record["download_info"])):
+                pending.append(DownloadInfo(**record["download_info"]))
+
+        if (pending):
+            logger.info(f"Resuming {len(pending)} downloads that are missing metadata")
+        return (pending)
+
+    def checkpoint(self, dump, report: dict = None):
+        """ Run 'dump' to persist the state recorded in the journal, then empty the journal.
+            Entries that are still waiting for metadata are kept so the next run resumes them.
+            Records are held off until the journal is emptied so none are lost.
+
+            Arguments:
+                dump:   Persists the report
+                report: Report persisted by 'dump' when it only holds some of the entries, ex. the
+                        TUI's. Records of other entries that aren't tagged are kept
+        """
+        with self.lock:
+            dump()
+            pending = [record for record in self.load().values()
+                       if (((JournalState.DOWNLOADED == record["state"])
+                            and (record["download_info"]))
+                           or ((report is not None)
+                               and (JournalState.TAGGED != record["state"])
+                               and (record["url"] not in report)))]
+            tmp_path = str(self.path) + ".tmp"
+            with open(tmp_path, "w") as fptr:
+                fptr.write("".join(json.dumps(record) + "\n" for record in pending))
+                fptr.flush()
+                os.fsync(fptr.fileno())
+            os.replace(tmp_path, self.path)
@@ -31,35 +31,45 @@
 #################################################################################
 
 import os
+import dbm
 import time
-import json
+import atexit
 import shutil
-import urllib
+import shelve
 import base64
 import logging
 import pathlib
 import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
 
 
 import globals
 import lyricsgenius
-from PIL import Image
 from mutagen import File
 from mutagen.mp3 import MP3
 from mutagen.oggopus import OggOpus
 from utils.common import MetadataCtx
+from genres import get_genre_registry
 from utils.ctl_logging import tui_log
-from mutagen.mp4 import MP4, MP4Cover
 from playlists import PlaylistHandler
 from mutagen.flac import FLAC, Picture
 from mutagen.oggvorbis import OggVorbis
+from utils.rate_limit import rate_limit
 from utils.common import sanitize_string
 from music_brainz import musicbrainz_search
+from utils.retry import ProviderUnavailableError
 from utils.common import Providers, DownloadInfo
 from youtube_title_parse import get_artist_title
+from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+from utils.thumbnail_cache import get_thumbnail_cache
+from utils.image_probe import image_size, picture_size
+from utils.image_probe import IMAGE_PROBE_BYTES, FLAC_PICTURE_BLOCK
+from covers import ALBUM_COVERS_EMBED, ALBUM_COVERS_NONE, ALBUM_THUMBNAIL_SIZE
 from report import ReportStatus, update_report_status, add_to_report_post_search
+from covers import get_cover_normalizer, get_album_cover_store, is_album_cover_url
 
 from mutagen.id3 import (
     TIT2, TOPE, TALB, TRCK,
@@ -70,46 +80,185 @@ from mutagen.id3 import (
 logger = logging.getLogger(__name__)
 
 META_MAX_THUMBNAIL_RETRIES = 5
+# Seconds until a song that had no lyrics is searched for again
+LYRICS_NEGATIVE_TTL = 7 * 24 * 60 * 60
+LYRICS_FETCH_WORKERS = 4
+# Base64 characters of an embedded picture decoded to find its dimensions
+PICTURE_PROBE_CHARS = 4 * (IMAGE_PROBE_BYTES // 3)
+# Errors of the lyrics disk cache, which are treated as cache misses
+LYRICS_CACHE_ERRORS = (*dbm.error, OSError)
+# Tags of the MusicBrainz release id, the name of the album's folder in the album cover store
+MUSICBRAINZ_ALBUM_ID_DESC = "MusicBrainz Album Id"
+MP4_MUSICBRAINZ_ALBUM_ID = f"----:com.apple.iTunes:{MUSICBRAINZ_ALBUM_ID_DESC}"
 
 
 class LyricHandler:
-    def __init__(self, api_key: str, verbosity: bool = False):
+    """ Obtains lyrics from Genius. Results are cached in memory and, when a cache path is given,
+        on disk so that the same song is only searched for once. Searches that found no lyrics
+        are searched again once LYRICS_NEGATIVE_TTL has passed. """
+
+    def __init__(self, api_key: str, verbosity: bool = False, cache_path: str = None):
         self.genius_ctx = lyricsgenius.Genius(api_key, verbose=verbosity)
+        self.cache_path = cache_path
+        self.cache = {}
+        # Disk cache, opened once on first use
+        self.db = None
+        self.cache_lock = threading.Lock()
+        if (cache_path):
+            atexit.register(self.close)
+
+    @staticmethod
+    def _cache_key(title: str, artist: str) -> str:
+        return ("\x1f".join(" ".join((value or "").lower().split()) for value in (title, artist)))
+
+    def _open_cache(self):
+        """ Get the disk cache, opening it on first use. Must be called with the cache lock held.
+
+            Returns:
+                The shelf, None if there is no disk cache or it can't be opened
+        """
+        if ((self.db is None) and (self.cache_path)):
+            try:
+                self.db = shelve.open(str(self.cache_path))
+            except LYRICS_CACHE_ERRORS:
+                logger.warning(f"Unable to open lyrics cache {self.cache_path}, lyrics are only "
+                               "cached in memory", exc_info=True)
+                self.cache_path = None
+        return (self.db)
+
+    def _cache_get(self, key: str) -> (bool, str):
+        """ Get (whether the cached result is usable, lyrics) of a cache key. Cache errors are
+            treated as a miss. """
+        with self.cache_lock:
+            entry = self.cache.get(key, None)
+            db = self._open_cache() if (entry is None) else None
+            if (db is not None):
+                try:
+                    entry = db.get(key, None)
+                except LYRICS_CACHE_ERRORS:
+                    logger.warning(f"Unable to read lyrics cache {self.cache_path}", exc_info=True)
+                if (entry is not None):
+                    self.cache[key] = entry
+
+        if (entry is None):
+            return (False, None)
+        if ((entry["lyrics"] is None) and (LYRICS_NEGATIVE_TTL < (time.time() - entry["time"]))):
+            return (False, None)
+        return (True, entry["lyrics"])
+
+    def _cache_put(self, key: str, lyrics: str):
+        """ Cache the lyrics of a cache key. The result stays in memory when the disk cache
+            can't be written. """
+        entry = {"lyrics": lyrics, "time": time.time()}
+        with self.cache_lock:
+            self.cache[key] = entry
+            db = self._open_cache()
+            if (db is not None):
+                try:
+                    db[key] = entry
+                except LYRICS_CACHE_ERRORS:
+                    logger.warning(f"Unable to write lyrics cache {self.cache_path}", exc_info=True)
+
+    def close(self):
+        with self.cache_lock:
+            if (self.db is not None):
+                try:
+                    self.db.close()
+                except LYRICS_CACHE_ERRORS:
+                    logger.warning(f"Unable to close lyrics cache {self.cache_path}", exc_info=True)
+                self.db = None
+
+    def prime(self, title: str, artist: str, lyrics: str):
+        """ Cache lyrics that are already known, such as those found when a report was filled,
+            so they aren't searched for again. Only the in-memory cache is filled. """
+        key = self._cache_key(title, artist)
+        with self.cache_lock:
+            self.cache.setdefault(key, {"lyrics": lyrics, "time": time.time()})
 
     def obtain_lyrics(self, title: str, artist: str):
+        key = self._cache_key(title, artist)
+        cached, lyrics = self._cache_get(key)
+        if (cached):
+            return (lyrics)
+
+        # Searching makes one request for the search and another for the lyrics page
+        rate_limit("genius", 2)
         song = self.genius_ctx.search_song(title, artist)
-        return (song.lyrics if song else None)
+        lyrics = song.lyrics if song else None
+        self._cache_put(key, lyrics)
+        return (lyrics)
+
+    def obtain_lyrics_batch(self, tracks: list[tuple[str, str]],
+                            workers: int = LYRICS_FETCH_WORKERS) -> list[str]:
+        """ Obtain the lyrics of several (title, artist) tracks concurrently.
+
+            Returns:
+                Lyrics in the order of 'tracks'. None for tracks without lyrics or whose search
+                failed
+        """
+        def fetch(track):
+            try:
+                return (self.obtain_lyrics(*track))
+            except Exception:
+                logger.warning(f"Unable to obtain lyrics of {track}", exc_info=True)
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ctl_lyrics") as executor:
+            return (list(executor.map(fetch, tracks)))
+
+
+def get_flac_picture_res(path: str) -> tuple:
+    """ Get resolution of the first picture of a FLAC file, reading only the block headers. """
+    with open(path, "rb") as fptr:
+        if (b"fLaC" != fptr.read(4)):
+            return None
+        while (True):
+            block_header = fptr.read(4)
+            if (4 > len(block_header)):
+                return None
+            length = int.from_bytes(block_header[1:], "big")
+            if (FLAC_PICTURE_BLOCK == (block_header[0] & 0x7F)):
+                return (picture_size(fptr.read(min(length, IMAGE_PROBE_BYTES))))
+            # Last metadata block
+            if (block_header[0] & 0x80):
+                return None
+            fptr.seek(length, os.SEEK_CUR)
 
 
 def get_embedded_thumbnail_res(path: str) -> tuple:
-    """ Get resolution of a thumbnail from its embedded metadata. """
+    """ Get resolution of a thumbnail from its embedded metadata, parsing only its headers.
+
+        Returns:
+            (width, height), (None, None) if there is no readable thumbnail
+    """
     ext = pathlib.Path(path).suffix
+    resolution = None
     match ext:
         case ".mp3":
-            audio = ID3(path)
-            thumb_data = audio[APIC].data
-            return (Image.open(BytesIO(thumb_data)).size)
+            pictures = ID3(path).getall("APIC")
+            if (pictures):
+                resolution = image_size(pictures[0].data[:IMAGE_PROBE_BYTES])
         case ".mp4" | ".m4a":
-            audio = MP4(path)
-            thumb_data = BytesIO(audio["covr"])
-            return (Image.open(thumb_data).size)
-        case ".opus" | ".ogg" | ".flac":
+            covers = MP4(path).get("covr", [])
+            if (covers):
+                resolution = image_size(bytes(covers[0][:IMAGE_PROBE_BYTES]))
+        case ".opus" | ".ogg":
             audio = {".opus": OggOpus, ".ogg": OggVorbis}[ext](path)
             for data in audio.get("metadata_block_picture", []):
+                # Only the start of the picture is decoded, base64 is decoded in groups of 4
                 try:
-                    data = base64.b64decode(data)
+                    resolution = picture_size(base64.b64decode(data[:PICTURE_PROBE_CHARS]))
                 except (TypeError, ValueError):
                     continue
-            picture = Picture(data)
-            return (picture.width, picture.height)
+                if (resolution):
+                    break
         case ".flac":
-            pic = audio.pictures[0]
-            width = pic.width
-            height = pic.height
-            return (width, height)
+            resolution = get_flac_picture_res(path)
         case _:
             logger.warning(f"Unsupported Filetype: {ext[1:]}")
 
+    return (resolution or (None, None))
+
 
 def delete_file_tags(filepath: str):
     """ Delete tags embedded within the given file. """
@@ -119,17 +268,10 @@ def delete_file_tags(filepath: str):
 
 
 def request_thumbnail(url):
-    for i in range(0, META_MAX_THUMBNAIL_RETRIES):
-        try:
-            with urllib.request.urlopen(url) as response:
-                return (response.read())
-        except Exception:
-            tui_log(f"{i}: Image obtain failed...retrying")
-            time.sleep(i+1**3)
-            continue
-
-        tui_log(f"{i}: Image obtain failed...retrying")
-        return None
+    data = get_thumbnail_cache().get(url, retries=META_MAX_THUMBNAIL_RETRIES)
+    if (data is None):
+        tui_log("Image obtain failed")
+    return (data)
 
 
 def obtain_thumbnail_bytes(url: str):
@@ -137,15 +279,49 @@ def obtain_thumbnail_bytes(url: str):
         logger.warning("Url passed is none")
         return None
 
-        response = request_thumbnail(url)
-        return (BytesIO(response))
+    response = request_thumbnail(url)
+    return (BytesIO(response) if response else None)
+
+
+def get_tag_snapshot(file_metadata) -> list:
+    """ Comparable copy of the tags (and FLAC pictures) of a mutagen file. """
+    if (file_metadata.tags is None):
+        return None
+    snapshot = sorted((str(key), repr(value)) for key, value in file_metadata.tags.items())
+    snapshot += [picture.write() for picture in getattr(file_metadata, "pictures", [])]
+    return (snapshot)
+
+
+def prepare_cover(in_metadata: MetadataCtx, data: bytes) -> bytes:
+    """ Get the cover to embed in a track from the cover 'data'. When album covers are shared the
+        cover file of the album is written and only a thumbnail, or nothing, is embedded.
+
+        Only Cover Art Archive images replace the cover of an album that already has one. Other
+        covers, ex. one entered for a single track, are embedded in the track instead.
+
+        Returns:
+            The cover to embed, None if no cover should be embedded
+    """
+    if ((not in_metadata.release_mbid) or (ALBUM_COVERS_EMBED == globals.ALBUM_COVERS)):
+        return (get_cover_normalizer().normalize(data))
+
+    store = get_album_cover_store(os.path.dirname(in_metadata.path))
+    if ((not is_album_cover_url(in_metadata.thumbnail_url))
+            and store.has(in_metadata.release_mbid)):
+        return (get_cover_normalizer().normalize(data))
+
+    cover = store.add(in_metadata.release_mbid, data)
+    if (ALBUM_COVERS_NONE == globals.ALBUM_COVERS):
+        return None
+    return (get_cover_normalizer().resize(cover, ALBUM_THUMBNAIL_SIZE))
 
 
 def tag_file(in_metadata: MetadataCtx, clear: bool, lyric_handler: LyricHandler):
-    """ Tag File With Information Passed. """
+    """ Tag File With Information Passed.
 
-    if (clear):
-        delete_file_tags(in_metadata.path)
+        The complete tag set is built in memory, replacing the existing tags when 'clear' is set,
+        and written with a single save. The file isn't written at all if its tags are unchanged.
+    """
 
     extension = Path(in_metadata.path).suffix
 
@@ -154,51 +330,92 @@ def tag_file(in_metadata: MetadataCtx, clear: bool, lyric_handler: LyricHandler)
     if (not mimetype):
         mimetype = "image/jpeg"
 
+    lyrics = None
     if (lyric_handler):
         lyrics = lyric_handler.obtain_lyrics(in_metadata.title, in_metadata.artist)
         tui_log(f"LYRICS: {lyrics}")
 
+    if (extension not in [".mp3", ".m4a", ".mp4", ".ogg", ".opus", ".flac"]):
+        raise ValueError("Unsupported FileType Passed To Tag Handler. "
+                         "Supported Types Are: flac, opus, ogg, mp3, and mp4")
+
+    # Obtained before the file is touched so a failure leaves the existing tags in place
+    thumbnail = request_thumbnail(in_metadata.thumbnail_url)
+    if (not thumbnail):
+        return False
+    # Prepared while the file is loaded
+    embedded_cover = get_cover_normalizer().submit(prepare_cover, in_metadata, thumbnail)
+
     if (".mp3" == extension):
         file_metadata = MP3(in_metadata.path)
-        file_metadata.setall(TIT2(in_metadata.title, encoding=Encoding.UTF8))
-        file_metadata.setall(TOPE(in_metadata.artist, encoding=Encoding.UTF8))
-        file_metadata.setall(TDAT(getattr(in_metadata, "date", ""), encoding=Encoding.UTF8))
-        file_metadata.setall(TXXX("artists", text=in_metadata.artists, encoding=Encoding.UTF8))
-        file_metadata.setall(TALB(getattr(in_metadata, "album", ""), encoding=Encoding.UTF8))
-        file_metadata.setall(TCON(getattr(in_metadata, "genres", ""), encoding=Encoding.UTF8))
-        file_metadata.setall(
-            TRCK(getattr(in_metadata, "track_number", ""), encoding=Encoding.UTF8))
-        thumbnail = obtain_thumbnail_bytes(in_metadata.thumbnail_url)
-        if not thumbnail:
-            return False
-        file_metadata.setall(USLT(lyrics or "", encoding=Encoding.UTF8))
-        file_metadata.setall("APIC", [APIC(
+    elif (extension in [".m4a", ".mp4"]):
+        file_metadata = MP4(in_metadata.path)
+    else:
+        file_metadata = {
+            '.opus': OggOpus, '.flac': FLAC, '.ogg': OggVorbis}[extension](in_metadata.path)
+
+    previous_tags = get_tag_snapshot(file_metadata)
+    if (file_metadata.tags is None):
+        file_metadata.add_tags()
+    elif (clear):
+        file_metadata.tags.clear()
+        if (".flac" == extension):
+            file_metadata.clear_pictures()
+
+    cover = embedded_cover.result()
+    if (cover != thumbnail):
+        mimetype = "image/jpeg"
+    thumbnail = cover
+    thumbnail_width, thumbnail_height = ((thumbnail and image_size(thumbnail[:IMAGE_PROBE_BYTES]))
+                                         or (in_metadata.thumbnail_width,
+                                             in_metadata.thumbnail_height))
+
+    if (".mp3" == extension):
+        tags = file_metadata.tags
+        text_frames = [
+            (TIT2, in_metadata.title),
+            (TOPE, in_metadata.artist),
+            (TDAT, getattr(in_metadata, "date", "")),
+            (TALB, getattr(in_metadata, "album", "")),
+            (TCON, getattr(in_metadata, "genres", "")),
+            (TRCK, getattr(in_metadata, "track_number", "")),
+        ]
+        for frame, text in text_frames:
+            # Empty frames aren't written, leaving them out keeps the comparison with the file exact
+            tags.setall(frame.__name__, [frame(text=text, encoding=Encoding.UTF8)] if text else [])
+        tags.setall("TXXX:artists", [TXXX(desc="artists", text=in_metadata.artists,
+                                          encoding=Encoding.UTF8)] if in_metadata.artists else [])
+        tags.setall(f"TXXX:{MUSICBRAINZ_ALBUM_ID_DESC}", [TXXX(
+            desc=MUSICBRAINZ_ALBUM_ID_DESC, text=in_metadata.release_mbid,
+            encoding=Encoding.UTF8)] if in_metadata.release_mbid else [])
+        tags.setall("USLT", [USLT(text=lyrics or "", encoding=Encoding.UTF8)])
+        tags.setall("APIC", [APIC(
             desc="Cover",
             mime=mimetype,
             type=PictureType.COVER_FRONT,
             data=thumbnail
-        )])
-        file_metadata.save()
+        )] if thumbnail else [])
     elif (extension in [".m4a", ".mp4"]):
-        file_metadata = MP4(in_metadata.path)
-        file_metadata["\xa9nam"] = in_metadata.title
-        file_metadata["\xa9ART"] = in_metadata.artist
-        file_metadata["----:TXXX:artists"] = in_metadata.artists
-        file_metadata["\xa9day"] = getattr(in_metadata, "date", "")
-        file_metadata["\xa9alb"] = getattr(in_metadata, "album", "")
-        file_metadata["\xa9gen"] = getattr(in_metadata, "genres", "")
-        file_metadata["\xa9lyr"] = lyrics or ""
+        # Values are set as lists, the form they are loaded in, so unchanged tags compare equal
+        file_metadata["\xa9nam"] = [in_metadata.title]
+        file_metadata["\xa9ART"] = [in_metadata.artist]
+        file_metadata["----:TXXX:artists"] = [MP4FreeForm(artist.encode())
+                                              for artist in in_metadata.artists]
+        file_metadata["\xa9day"] = [getattr(in_metadata, "date", "")]
+        file_metadata["\xa9alb"] = [getattr(in_metadata, "album", "")]
+        file_metadata["\xa9gen"] = getattr(in_metadata, "genres", [])
+        file_metadata["\xa9lyr"] = [lyrics or ""]
+        if (in_metadata.release_mbid):
+            file_metadata[MP4_MUSICBRAINZ_ALBUM_ID] = [
+                MP4FreeForm(in_metadata.release_mbid.encode())]
+        else:
+            file_metadata.tags.pop(MP4_MUSICBRAINZ_ALBUM_ID, None)
         image_format = MP4Cover.FORMAT_JPEG if mimetype == "image/jpeg" else MP4Cover.FORMAT_PNG
-        thumbnail = obtain_thumbnail_bytes(in_metadata.thumbnail_url)
-        if not thumbnail:
-            return False
-        file_metadata["covr"] = [MP4Cover(thumbnail, imageformat=image_format)]
-        file_metadata.save()
-
-    elif (extension in [".ogg", ".opus", ".flac"]):
-        file_metadata = {
-            '.opus': OggOpus, '.flac': FLAC, '.ogg': OggVorbis}[extension](in_metadata.path)
-
+        if (thumbnail):
+            file_metadata["covr"] = [MP4Cover(thumbnail, imageformat=image_format)]
+        else:
+            file_metadata.tags.pop("covr", None)
+    else:
         file_metadata["title"] = in_metadata.title
         file_metadata["artists"] = in_metadata.artists
         file_metadata["artist"] = in_metadata.artist
@@ -207,29 +424,34 @@ def tag_file(in_metadata: MetadataCtx, clear: bool, lyric_handler: LyricHandler)
         file_metadata["tracknumber"] = getattr(in_metadata, "track_number", "")
         file_metadata["genres"] = getattr(in_metadata, "genres", "")
         file_metadata["lyrics"] = lyrics or ""
+        file_metadata["musicbrainz_albumid"] = (
+            [in_metadata.release_mbid] if in_metadata.release_mbid else [])
 
         picture = Picture()
         picture.desc = u"Cover"
         picture.mime = mimetype
         picture.type = PictureType.COVER_FRONT
-        picture.width = in_metadata.thumbnail_width
-        picture.height = in_metadata.thumbnail_height
-        picture.data = request_thumbnail(in_metadata.thumbnail_url)
-        if (not picture.data):
-            return False
+        picture.width = thumbnail_width or 0
+        picture.height = thumbnail_height or 0
+        picture.data = thumbnail
 
         if (".flac" == extension):
-            file_metadata.add_picture(picture)
-        else:
+            file_metadata.clear_pictures()
+            if (thumbnail):
+                file_metadata.add_picture(picture)
+        elif (thumbnail):
             picture_data = picture.write()
             encoded_data = base64.b64encode(picture_data)
             comment_val = encoded_data.decode("ascii")
             file_metadata["metadata_block_picture"] = [comment_val]
-        file_metadata.save()
-    else:
-        raise ValueError("Unsupported FileType Passed To Tag Handler. "
-                         "Supported Types Are: flac, opus, ogg, mp3, and mp4")
+        else:
+            file_metadata["metadata_block_picture"] = []
+
+    if (get_tag_snapshot(file_metadata) == previous_tags):
+        logger.debug(f"Tags of '{in_metadata.path}' are unchanged, skipping save")
+        return True
 
+    file_metadata.save()
     return True
 
 
@@ -254,9 +476,14 @@ def fill_report_metadata(user_agent: str,
             provider:           Provider or download
             url:                URL of song
             report:             Dictionary of download status reports. Optional.
-            lyric_handler:      Handler of lyric retrieval
+            lyric_handler:      Handler of lyric retrieval. When None with a report, lyrics are
+                                left for the caller to fill
             path:               Path of file. Only required if report is None.
             playlist_hanlder:   Playlist handler to use to obtain playlists
+
+        Raises:
+            ProviderUnavailableError: Metadata providers are unavailable when filling a report,
+                                      the song should be retried later
     """
 
     if (not download_info):
@@ -287,7 +514,8 @@ def fill_report_metadata(user_agent: str,
             "thumbnail_url": meta.thumbnail_url,
             "thumbnail_width": meta.thumbnail_resolution,
             "thumbnail_height": meta.thumbnail_resolution,
-            "lyrics": lyric_handler.obtain_lyrics(meta.title, meta.artist)
+            "lyrics": (lyric_handler.obtain_lyrics(meta.title, meta.artist)
+                       if lyric_handler else None)
         },
             report,
             url,
@@ -302,9 +530,14 @@ def fill_report_metadata(user_agent: str,
                 parsed_title = title
                 parsed_artist = uploader
 
-        meta = musicbrainz_search(user_agent,
-                                  parsed_title,
-                                  parsed_artist)
+        try:
+            meta = musicbrainz_search(user_agent,
+                                      parsed_title,
+                                      parsed_artist)
+        except ProviderUnavailableError as error:
+            # Metadata is confirmed by hand here, so the song is filled in without a search
+            tui_log(f"{error}, skipping metadata search")
+            meta = None
         if (meta):
             output = MetadataCtx(title=meta.title,
                                  artist=meta.artist,
@@ -318,6 +551,7 @@ def fill_report_metadata(user_agent: str,
                                  thumbnail_url=meta.thumbnail_url,
                                  thumbnail_width=meta.thumbnail_resolution,
                                  thumbnail_height=meta.thumbnail_resolution,
+                                 release_mbid=meta.release_mbid,
                                  lyrics=lyric_handler.obtain_lyrics(meta.title, meta.artist),
                                  playlists=playlist_handler.check_playlists(download_info.url))
             return output
@@ -355,50 +589,29 @@ def replace_metadata(metadata: MetadataCtx, lyric_handler: LyricHandler):
     return (new_filepath)
 
 
-GENRE_MAPPINGS = [
-    ('&', "and"),
-]
-
-
 def handle_genre(in_genre: list):
     if (not in_genre):
         logger.debug("No Genres Specified")
         return None
 
-    # Drum & Bass drum and bass
-    with open(globals.GENRE_PATH, "r") as fptr:
-        genres = json.load(fptr)
-
+    genres = get_genre_registry()
     output = []
     # Remove duplicated and make all lowercase to match musicbrainz
-    in_genre = list(set([genre.lower() for genre in in_genre]))
+    in_genre = list(set([genre.lower().strip() for genre in in_genre]))
     logger.debug(f"Lower In Genres: {in_genre}")
     for genre in in_genre:
-        if (genre in genres):
-            output.append(genre)
-            logger.debug("Genre Found")
-            continue
-
-        genre = genre.lstrip().rstrip()
-        logger.debug(f"Stripped Genre: {genre}")
-        if (genre in genres):
-            output.append(genre)
-            logger.debug("Genre Found")
+        if (not genre):
             continue
-
-        for item in GENRE_MAPPINGS:
-            if (item[0] in genre):
-                genre = genre.replace(item[0], item[1])
-                logger.debug(f"Mapping Found: {item[0]}->{item[1]}")
-                if (genre in genres):
-                    output.append(genre)
-                    logger.debug("Genre Found")
-                    break
+        # Matches spellings of known genres. ex. Drum & Bass, drum n bass and dnb
+        known_genre = genres.match(genre)
+        if (known_genre):
+            logger.debug(f"Genre Found: {known_genre}")
         else:
             logger.debug(f"New Genre Found: {genre}...Adding To Genre List")
-            genres.append(genre)
-            with open(globals.GENRE_PATH, "w") as fptr:
-                json.dump(genres, fptr)
-            output.append(genre)
+            genres.add(genre)
+            known_genre = genre
+
+        if (known_genre not in output):
+            output.append(known_genre)
 
     return output
@@ -42,6 +42,8 @@ from dataclasses import dataclass, field
 import globals
 from mbzero import mbzrequest as mbr
 from mbzero import mbzerror, caarequest
+from utils.rate_limit import rate_limit
+from utils.retry import backoff_delay, get_breaker, ProviderUnavailableError
 
 
 MUSICBRAINZ_RETRIES = 10
@@ -84,10 +86,15 @@ def musicbrainz_obtain_caa_image_data(user_agent: str, release_mbid: str) -> (st
         logger.warning("Release mbid is none...Can't obtain user_agent.")
         return (None, None)
 
+    breaker = get_breaker("coverartarchive")
     logger.info(f"Searching for {release_mbid} in CAA.")
     for i in range(1, MAX_THUMBNAIL_RETRIES+1):
+        if (not breaker.allow()):
+            raise ProviderUnavailableError("coverartarchive", breaker.retry_after())
         try:
+            rate_limit("coverartarchive")
             request_content = caarequest.CaaRequest(user_agent, "release", release_mbid).send()
+            breaker.record_success()
             content_json = json.loads(request_content.decode("utf-8"))
             images = content_json.get("images", [])
             if (not images):
@@ -111,15 +118,22 @@ def musicbrainz_obtain_caa_image_data(user_agent: str, release_mbid: str) -> (st
                 break
 
         except mbzerror.MbzNotFoundError:
+            breaker.record_success()
             break
         except mbzerror.MbzWebServiceError as e:
-            delay = i ** 2
+            breaker.record_failure()
+            delay = backoff_delay(i)
             logger.info(type(e).__name__)
-            logger.info(f"Musicbrainz service error, retrying in {delay}s...")
+            logger.info(f"Musicbrainz service error, retrying in {delay:.1f}s...")
             time.sleep(delay)
             continue
+        except Exception:
+            breaker.release_trial()
+            raise
+    else:
+        logger.info("Failed to request image from CAA.")
+        raise ProviderUnavailableError("coverartarchive", breaker.retry_after())
 
-    logger.info("Failed to request image from CAA.")
     return ((None, None))
 
 
@@ -131,25 +145,45 @@ def musicbrainz_construct_user_agent(email: str) -> str:
 
 
 def musicbrainz_search(user_agent: str, title: str, artist: str) -> MusicbrainzMetadata:
-    """ Search music brainz database for metadata relating to the title and artist specified. """
+    """ Search music brainz database for metadata relating to the title and artist specified.
+
+        Raises:
+            ProviderUnavailableError: MusicBrainz or the Cover Art Archive is paused or kept
+                                      failing, the search should be retried later
+    """
 
     content = None
+    breaker = get_breaker("musicbrainz")
     for i in range(1, MUSICBRAINZ_RETRIES+1):
+        if (not breaker.allow()):
+            raise ProviderUnavailableError("musicbrainz", breaker.retry_after())
         try:
 
             search = mbr.MbzRequestSearch(user_agent, "recording",
                                           f'artist:"{artist}" AND recording:"{title}"')
+            rate_limit("musicbrainz")
             content = search.send()
+            breaker.record_success()
             logger.debug(f"music brainz search url: {
                          search.url}/{search.entity_type}?query={search.query}&fmt=json")
             break
+        except mbzerror.MbzNotFoundError:
+            breaker.record_success()
+            break
         except mbzerror.MbzWebServiceError:
-            delay = i ** 2
-            logger.debug(f"Musicbrainz service error, retrying in {delay}...", exc_info=True)
+            breaker.record_failure()
+            delay = backoff_delay(i)
+            logger.debug(f"Musicbrainz service error, retrying in {delay:.1f}...", exc_info=True)
             time.sleep(delay)
             continue
-        except mbzerror.MbzNotFoundError:
-            break
+        except Exception:
+            breaker.release_trial()
+            raise
+    else:
+        raise ProviderUnavailableError("musicbrainz", breaker.retry_after())
+
+    if (content is None):
+        return None
 
     content_json = json.loads(content.decode("utf-8"))
 
@@ -210,8 +244,6 @@ def musicbrainz_search(user_agent: str, title: str, artist: str) -> MusicbrainzM
 
         output.release_mbid = release.get("id", None)
         if (output.release_mbid):
-            # To give music brainz ample time between requests, sleep based on previous sleep count
-            time.sleep(10 if i**2 < 10 else i**2)
             output.thumbnail_url, output.thumbnail_resolution = musicbrainz_obtain_caa_image_data(
                 user_agent,
                 output.release_mbid)
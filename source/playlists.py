@@ -31,20 +31,314 @@
 #################################################################################
 
 import os
+import json
+import time
+import fcntl
+import shelve
 import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import globals
 from yt_dlp import YoutubeDL
-from utils.common import MetadataCtx
 from utils.ctl_logging import tui_log
+from ytdl_session import YoutubeDLSession
+from utils.rate_limit import rate_limit_url
+from utils.common import MetadataCtx, entry_archive_id
 
 logger = logging.getLogger(__name__)
 
+# Amount of buffered playlist entries that causes the playlist files to be written
+PLAYLIST_WRITE_BATCH_SIZE = 50
+# Smallest fraction of the songs of a local playlist that its upstream playlist must still have
+# for it to be reconciled, a sharper drop is more likely a failed extraction than removals
+RECONCILE_MIN_UPSTREAM_RATIO = 0.5
+
+
+class PlaylistSnapshots:
+    """ Archive ids of the entries of every playlist that were handled by a previous sync.
+        Stored in the ctldl shelf as:
+            {playlist id: {"title": str, "synced": iso time, "entries": {entry id: iso time}}}
+    """
+
+    SHELF_KEY = "playlist_snapshots"
+
+    def __init__(self):
+        with shelve.open(globals.SHELF_NAME) as db:
+            self.snapshots = db.get(self.SHELF_KEY, {})
+        self.lock = threading.Lock()
+
+    def get_entry_ids(self, playlist_info: dict) -> set:
+        """ Get the set of entry ids handled by the previous sync of the playlist. """
+        snapshot = self.snapshots.get(entry_archive_id(playlist_info), {})
+        return (set(snapshot.get("entries", {})))
+
+    def diff(self, playlist_info: dict) -> (set, set):
+        """ Get the (new, removed) entry ids of a playlist since its last sync. """
+        previous_ids = self.get_entry_ids(playlist_info)
+        current_ids = {entry_archive_id(entry) for entry in playlist_info.get("entries", [])}
+        current_ids.discard(None)
+        return ((current_ids - previous_ids), (previous_ids - current_ids))
+
+    def update(self, playlist_info: dict, archived_ids: set):
+        """ Replace the snapshot of a playlist with the entries that are in 'archived_ids' or were
+            archived by the previous sync. Entries removed from the playlist are dropped. """
+        playlist_id = entry_archive_id(playlist_info)
+        if (not playlist_id):
+            return
+
+        now = datetime.datetime.now().isoformat()
+        with self.lock:
+            previous = self.snapshots.get(playlist_id, {}).get("entries", {})
+            entries = {}
+            for entry in playlist_info.get("entries", []):
+                entry_id = entry_archive_id(entry)
+                if (entry_id in previous):
+                    entries[entry_id] = previous[entry_id]
+                elif (entry_id in archived_ids):
+                    entries[entry_id] = now
+
+            self.snapshots[playlist_id] = {
+                "title": playlist_info.get("title", None),
+                "synced": now,
+                "entries": entries
+            }
+
+    def save(self):
+        with self.lock, shelve.open(globals.SHELF_NAME) as db:
+            db[self.SHELF_KEY] = self.snapshots
+
+
+class PlaylistCache:
+    """ Flat extraction info of playlists stored on disk so that they don't have to be extracted
+        again by every run. Stored as json:
+            {playlist url: {"extracted": epoch seconds, "info": extraction info}}
+    """
+
+    def __init__(self, path: str, ttl: float = None):
+        """
+            Arguments:
+                path:   Path of the cache file
+                ttl:    Seconds that an extraction stays fresh for. None if it never goes stale
+        """
+        self.path = path
+        self.ttl = ttl
+        self.cache = {}
+        if (os.path.exists(self.path)):
+            try:
+                with open(self.path, "r") as fptr:
+                    self.cache = json.load(fptr)
+            except (OSError, json.JSONDecodeError):
+                logger.warning(f"Unable to read playlist cache {self.path}, ignoring it",
+                               exc_info=True)
+
+    def get(self, url: str) -> dict:
+        """ Get the cached extraction info of a playlist url. None if missing or stale. """
+        cached = self.cache.get(url, None)
+        if (not cached):
+            return None
+        if ((self.ttl is not None) and (self.ttl < (time.time() - cached["extracted"]))):
+            return None
+        return (cached["info"])
+
+    def put(self, url: str, extraction_info: dict):
+        self.cache[url] = {
+            "extracted": time.time(),
+            "info": YoutubeDL.sanitize_info(extraction_info)
+        }
+
+    def save(self):
+        # Written to a temporary file first so a killed run can't leave a partial cache behind
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as fptr:
+            json.dump(self.cache, fptr)
+        os.replace(tmp_path, self.path)
+
+
+class PlaylistWriter:
+    """ Keeps the entries of m3u playlist files in memory so that songs can be added and removed
+        without rescanning the files. Every file is loaded once and changed files are rewritten
+        once per batch of changes instead of being opened for every song. Files are replaced
+        atomically so a crash never leaves a partially written playlist behind.
+
+        Every playlist is an ordered membership index of:
+            {song path: [directive lines that precede the song path (ex. #EXTINF)]}
+        so adding a song that is already in a playlist updates it in place instead of
+        duplicating it.
+
+        The TUI and the downloader can write the same playlists from separate processes. Writes
+        hold a lock on the playlist directory and a file that changed since it was loaded is
+        read again and has the changes made by this writer replayed on top of it, so neither
+        process undoes the adds and removals of the other.
+    """
+
+    M3U_HEADER = "#EXTM3U"
+
+    def __init__(self, batch_size: int = PLAYLIST_WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.playlists = {}
+        # (mtime, size) of every playlist file when it was last read or written by this writer
+        self.file_stats = {}
+        # Changes not yet written of every playlist {song path: directives or None if removed}
+        self.pending = {}
+        self.dirty = set()
+        self.pending_count = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _file_stat(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return (None)
+        return ((stat.st_mtime_ns, stat.st_size))
+
+    def _read(self, path: str) -> dict:
+        """ Read the membership index of a playlist file. """
+        entries = {}
+        if (not os.path.exists(path)):
+            return (entries)
+
+        directives = []
+        with open(path, "r") as fptr:
+            for line in fptr:
+                line = line.rstrip("\n")
+                if ((not line) or (self.M3U_HEADER == line)):
+                    continue
+                if (line.startswith("#")):
+                    directives.append(line)
+                    continue
+                if (line in entries):
+                    # Duplicates from before the index existed are dropped
+                    self.dirty.add(path)
+                entries.setdefault(line, directives)
+                directives = []
+        return (entries)
+
+    def _load(self, path: str) -> dict:
+        """ Get the membership index of a playlist file, loading it on first use. """
+        if (path in self.playlists):
+            return (self.playlists[path])
+
+        if (not os.path.exists(path)):
+            tui_log("Creating new playlist file")
+
+        self.file_stats[path] = self._file_stat(path)
+        entries = self._read(path)
+        self.playlists[path] = entries
+        return (entries)
+
+    def _changed(self, path: str) -> bool:
+        """ Mark a playlist as changed. Returns whether the batch is full. """
+        self.dirty.add(path)
+        self.pending_count += 1
+        return (self.batch_size <= self.pending_count)
+
+    def add(self, path: str, song_path: str, directives: list[str]):
+        """ Add a song to the playlist file at 'path' or update its directives if it is already
+            in the playlist. """
+        with self.lock:
+            entries = self._load(path)
+            if (entries.get(song_path, None) == directives):
+                return
+            entries[song_path] = directives
+            self.pending.setdefault(path, {})[song_path] = directives
+            flush = self._changed(path)
+        if (flush):
+            self.flush()
+
+    def songs(self, path: str) -> dict:
+        """ Get a copy of the membership index of the playlist file at 'path'. """
+        with self.lock:
+            return (dict(self._load(path)))
+
+    def prune(self, path: str, keep) -> int:
+        """ Remove every song of the playlist file at 'path' for which keep(song path, directives)
+            is false.
+
+            Returns:
+                Amount of songs removed
+        """
+        with self.lock:
+            entries = self._load(path)
+            removed = [song_path for song_path, directives in entries.items()
+                       if not keep(song_path, directives)]
+            for song_path in removed:
+                entries.pop(song_path)
+                self.pending.setdefault(path, {})[song_path] = None
+            if (removed):
+                self.dirty.add(path)
+        return (len(removed))
+
+    def _merge(self, path: str) -> dict:
+        """ Read a playlist file that was changed by another process and replay the changes
+            of this writer on top of it. """
+        entries = self._read(path)
+        for song_path, directives in self.pending.get(path, {}).items():
+            if (directives is None):
+                entries.pop(song_path, None)
+            else:
+                entries[song_path] = directives
+        self.playlists[path] = entries
+        return (entries)
+
+    def _write_playlist(self, path: str, entries: dict):
+        lines = [self.M3U_HEADER]
+        for song_path, directives in entries.items():
+            lines.extend(directives)
+            lines.append(song_path)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as fptr:
+            fptr.write("\n".join(lines) + "\n")
+            fptr.flush()
+            os.fsync(fptr.fileno())
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """ Write every changed playlist to its file. """
+        with self.lock:
+            # Merging can mark a playlist dirty again
+            for path in list(self.dirty):
+                dir_fd = None
+                try:
+                    # The file itself is replaced on every write so the directory is locked
+                    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+                    fcntl.flock(dir_fd, fcntl.LOCK_EX)
+                    entries = self.playlists[path]
+                    if (self._file_stat(path) != self.file_stats.get(path, None)):
+                        logger.debug(f"Playlist {path} changed on disk, merging changes")
+                        entries = self._merge(path)
+                    self._write_playlist(path, entries)
+                    self.file_stats[path] = self._file_stat(path)
+                except OSError:
+                    logger.error(f"Unable to write playlist {path}", exc_info=True)
+                finally:
+                    if (dir_fd is not None):
+                        os.close(dir_fd)
+            self.dirty = set()
+            self.pending = {}
+            self.pending_count = 0
+
 
 class PlaylistHandler:
 
-    def __init__(self,  retries, urls=None, info_ret=None, request_sleep=None):
+    # Directive of m3u entries that records the url the song was downloaded from
+    CTL_URL_DIRECTIVE = "#CTL-URL:"
+
+    def __init__(self,  retries, urls=None, info_ret=None, request_sleep=None, workers=None,
+                 cache=None):
         self.playlists = {}
+        # Amount of playlists extracted at once
+        self.workers = max(1, workers or 1)
+        self.cache = cache
+        self.playlist_writer = PlaylistWriter()
+        # Sets of the song urls of every playlist and the playlists of every song url, kept in
+        # sync with self.playlists by _set_playlist
+        self.playlist_url_sets = {}
+        self.url_index = {}
+        self.spec_positions = {}
         self.urls_populated = False
         self.request_sleep = request_sleep
 
@@ -65,60 +359,92 @@ class PlaylistHandler:
         }
 
         logger.debug("Adding URLS to playlist handler")
-        for index, url in enumerate(urls):
-            extraction_info = YoutubeDL(ydl_opts).extract_info(url, download=False)
-
-            # Soundcloud long link
-            if ("SoundcloudSet" == extraction_info["extractor_key"]):
-                if (info_ret is not None):
-                    info_ret.append(extraction_info)
-                if ("entries" in extraction_info):
-                    self.playlists[(url, extraction_info["album"])] = [
-                        entry["url"] for entry in
-                        extraction_info["entries"]]
-                else:
-                    logger.warning(f"{url} Does Not Seem To Be A Playlist")
-
-            # Soundcloud short link
-            # NOTE: Shortened links on Soundcloud return info of the longer link instead of
-            #       the playlist information, so another extraction must be done ~ BEF
-            elif ((url.startswith("https://on.soundcloud.com/"))
-                  and ("Generic" == extraction_info["extractor_key"])):
-
-                with YoutubeDL(ydl_opts) as ydl:
-                    extraction_info = ydl.extract_info(extraction_info["url"], download=False)
-                    if (info_ret is not None):
-                        info_ret.append(extraction_info)
-                    if ("entries" in extraction_info):
-                        self.playlists[(url, extraction_info["album"])] = [
-                            entry["url"] for entry in extraction_info["entries"]]
-                    else:
-                        logger.warning(f"{url} Does Not Seem To Be A Playlist")
-
-            # YouTube
-            elif ("YoutubeTab" == extraction_info["extractor_key"]):
-                if (info_ret is not None):
-                    info_ret.append(extraction_info)
-                if ("entries" in extraction_info):
-                    self.playlists[(url, extraction_info["title"])] = [
-                        entry["url"] for entry in extraction_info["entries"]]
-                else:
-                    logger.warning(f"{url} Does Not Seem To Be A Playlist")
-            else:
-                logger.warning(
-                    f"Unexpected Extraction Key/Domain: {extraction_info["extraction_key"]=}",
-                    f"{url=}")
+        cached = {}
+        if (self.cache):
+            cached = {url: self.cache.get(url) for url in urls}
+        stale_urls = [url for url in urls if not cached.get(url, None)]
+        if (len(stale_urls) < len(urls)):
+            logger.info(f"Using cached extraction of {len(urls) - len(stale_urls)}/{len(urls)} "
+                        "playlists")
+
+        # Playlists are extracted concurrently but added in the order of 'urls'
+        with YoutubeDLSession(ydl_opts) as session, \
+                ThreadPoolExecutor(max_workers=self.workers,
+                                   thread_name_prefix="ctl_playlist") as executor:
+            extracted = dict(zip(stale_urls, executor.map(
+                lambda url: self._extract_url(session.get(), url), stale_urls)))
+
+        for url in urls:
+            self._add_extraction(url, cached.get(url, None) or extracted[url], info_ret)
+
+        if (self.cache and extracted):
+            for url, extraction_info in extracted.items():
+                self.cache.put(url, extraction_info)
+            self.cache.save()
 
         self.urls_populated = True
         logging.debug("Urls added to playlist handler")
 
+    def _extract_url(self, ydl, url) -> dict:
+        """ Extract the flat playlist info of a single playlist url. """
+
+        rate_limit_url(url)
+        extraction_info = ydl.extract_info(url, download=False)
+
+        # Soundcloud short link
+        # NOTE: Shortened links on Soundcloud return info of the longer link instead of
+        #       the playlist information, so another extraction must be done ~ BEF
+        if ((url.startswith("https://on.soundcloud.com/"))
+                and ("Generic" == extraction_info["extractor_key"])):
+            rate_limit_url(extraction_info["url"])
+            extraction_info = ydl.extract_info(extraction_info["url"], download=False)
+
+        return (extraction_info)
+
+    def _add_extraction(self, url, extraction_info, info_ret=None):
+        """ Add the entries of an extracted playlist url to the handler. """
+
+        # Soundcloud
+        if ("SoundcloudSet" == extraction_info["extractor_key"]):
+            name_key = "album"
+        # YouTube
+        elif ("YoutubeTab" == extraction_info["extractor_key"]):
+            name_key = "title"
+        else:
+            logger.warning(
+                f"Unexpected Extraction Key/Domain: {extraction_info["extractor_key"]=} {url=}")
+            return
+
+        if (info_ret is not None):
+            info_ret.append(extraction_info)
+        if ("entries" in extraction_info):
+            self._set_playlist((url, extraction_info[name_key]),
+                               [entry["url"] for entry in extraction_info["entries"]])
+        else:
+            logger.warning(f"{url} Does Not Seem To Be A Playlist")
+
+    def _set_playlist(self, spec, urls):
+        """ Set the song urls of a playlist and update the indexes with the urls that changed. """
+
+        new_urls = set(urls)
+        old_urls = self.playlist_url_sets.get(spec, set())
+        for url in (old_urls - new_urls):
+            self.url_index[url].discard(spec)
+            if (not self.url_index[url]):
+                self.url_index.pop(url)
+        for url in (new_urls - old_urls):
+            self.url_index.setdefault(url, set()).add(spec)
+
+        self.spec_positions.setdefault(spec, len(self.spec_positions))
+        self.playlist_url_sets[spec] = new_urls
+        self.playlists[spec] = urls
+
     def check_playlists(self, url):
         """ Returns a list of playlists that 'url' is in (playlist url, playlist name) form. """
 
         if (not self.urls_populated):
             logger.warning("Urls Have Not Yet Been Populated")
-        return (
-            [spec for spec in self.playlists if url in self.playlists[spec]])
+        return (sorted(self.url_index.get(url, ()), key=self.spec_positions.get))
 
     def list_playlists_str(self):
         """ Returns list of playlist strings with no duplicates. """
@@ -137,9 +463,15 @@ class PlaylistHandler:
 
         return (out_list[0])
 
-    def write_to_playlists(self, metadata: MetadataCtx, outdir: str, url):
-        """ Write song to all playlist files it belongs to
+    def write_to_playlists(self, metadata: MetadataCtx, outdir: str, url, source_url=None):
+        """ Write song to all playlist files it belongs to, updating it if it is already in a
+            playlist. Changes are buffered by the playlist writer until flush_playlists is called
+            or the batch size is reached.
 
+            Arguments:
+                url:        Url to find the playlists of. metadata.playlists is used if None
+                source_url: Url the song was downloaded from, recorded so that the song can be
+                            pruned once it is removed from the upstream playlist. Defaults to url
         """
         if (metadata.path.startswith("#")):
             sanitized_path = "./" + os.path.basename(metadata.path)
@@ -148,31 +480,69 @@ class PlaylistHandler:
 
         if (url):
             # Here we are expecting the tuple output from self.check_playlists().
-            for playlist_spec in self.check_playlists(url):
-                if (not os.path.exists(f"{outdir}{playlist_spec[1]}.m3u")):
-                    with open(f"{outdir}{playlist_spec[1]}.m3u", "w") as f:
-                        f.write("#EXTM3U\n")
-                        f.write(f"#EXTINF:{metadata.duration},{
-                                metadata.artist} - {metadata.title}\n")
-                        f.write(sanitized_path + "\n")
-                else:
-                    with open(f"{outdir}{playlist_spec[1]}.m3u", "a") as f:
-                        f.write(f"#EXTINF:{metadata.duration},{
-                                metadata.artist} - {metadata.title}\n")
-                        f.write(sanitized_path + "\n")
+            playlist_specs = self.check_playlists(url)
         else:
             # Here we are expecting to be passed the tuple from metadata.playlists.
-            for playlist_spec in metadata.playlists:
-                if (not os.path.exists(f"{outdir}{playlist_spec[1]}.m3u")):
-                    tui_log("Creating new playlist file")
-                    with open(f"{outdir}{playlist_spec[1]}.m3u", "w") as f:
-                        f.write("#EXTM3U\n")
-                        f.write(f"#EXTINF:{metadata.duration},{
-                                metadata.artist} - {metadata.title}\n")
-                        f.write(sanitized_path + "\n")
-                else:
-                    tui_log("Appending to existing playlist file")
-                    with open(f"{outdir}{playlist_spec[1]}.m3u", "a") as f:
-                        f.write(f"#EXTINF:{metadata.duration},{
-                                metadata.artist} - {metadata.title}\n")
-                        f.write(sanitized_path + "\n")
+            playlist_specs = metadata.playlists
+
+        directives = [f"#EXTINF:{metadata.duration},{metadata.artist} - {metadata.title}"]
+        source_url = source_url or url
+        if (source_url):
+            directives.append(f"{self.CTL_URL_DIRECTIVE}{source_url}")
+
+        for playlist_spec in playlist_specs:
+            self.playlist_writer.add(f"{outdir}{playlist_spec[1]}.m3u", sanitized_path, directives)
+
+    def reconcile_playlists(self, outdir: str):
+        """ Remove songs from the local playlist files that were removed from their upstream
+            playlist. Only songs written with their source url can be matched to the upstream
+            playlist, others are left alone. Playlists whose extraction came back empty or much
+            smaller than the local playlist are skipped as the extraction likely failed. """
+
+        upstream_urls = {}
+        failed_paths = set()
+        for spec, urls in self.playlist_url_sets.items():
+            # Playlists with the same name share a playlist file
+            path = f"{outdir}{spec[1]}.m3u"
+            upstream_urls.setdefault(path, set()).update(urls)
+            if (not urls):
+                failed_paths.add(path)
+
+        def source_url(directives):
+            return (next((directive.removeprefix(self.CTL_URL_DIRECTIVE)
+                          for directive in directives
+                          if directive.startswith(self.CTL_URL_DIRECTIVE)), None))
+
+        for path, urls in upstream_urls.items():
+            if (not os.path.exists(path)):
+                continue
+
+            local_sources = [source_url(directives)
+                             for directives in self.playlist_writer.songs(path).values()]
+            local_urls = {url for url in local_sources if url}
+            untracked = len(local_sources) - len(local_urls)
+            if (path in failed_paths):
+                logger.warning(f"Not reconciling {os.path.basename(path)}, its upstream playlist "
+                               "came back empty")
+                continue
+            if (len(urls) < (RECONCILE_MIN_UPSTREAM_RATIO * len(local_urls))):
+                logger.warning(f"Not reconciling {os.path.basename(path)}, its upstream playlist "
+                               f"has {len(urls)} entries while the playlist has "
+                               f"{len(local_urls)}")
+                continue
+
+            # Songs without a source url are kept
+            keep_urls = urls | {None}
+            removed = self.playlist_writer.prune(
+                path, lambda song_path, directives: source_url(directives) in keep_urls)
+            # Songs without a source url can't be matched, they are assumed to be upstream songs
+            added = max(0, len(urls - local_urls) - untracked)
+            logger.info(f"Reconciled {os.path.basename(path)}: {added} upstream entries not yet "
+                        f"in the playlist, {removed} entries removed upstream, {untracked} "
+                        "entries without a source url left alone")
+
+        self.flush_playlists()
+
+    def flush_playlists(self):
+        """ Write all buffered playlist entries to their playlist files. """
+        self.playlist_writer.flush()
@@ -0,0 +1,141 @@
+###
+#  @file    postprocess.py
+#
+#  @brief   Runs yt-dlp postprocessors in worker processes
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import globals
+from yt_dlp import YoutubeDL
+from covers import get_cover_normalizer
+
+logger = logging.getLogger(__name__)
+
+# Codec that audio is transcoded to when it can't be kept as is
+DEFAULT_AUDIO_CODEC = "opus"
+
+# Source audio codecs that are only remuxed into the container of their codec when source codecs
+# are kept, as FFmpegExtractAudio stream copies when the preferred codec matches the source codec
+REMUX_CODECS = {
+    "opus": "opus",
+    "vorbis": "vorbis",
+    "aac": "m4a",
+    "mp4a": "m4a",
+}
+
+# Options and YoutubeDLs (by preferred codec) of the worker process
+_worker_opts = None
+_worker_ydls = {}
+
+
+def preferred_audio_codec(info: dict) -> str:
+    """ Get the codec that the audio of a download should end up in. Everything ends up in
+        DEFAULT_AUDIO_CODEC unless source codecs are kept. """
+    if (not globals.KEEP_SOURCE_CODEC):
+        return (DEFAULT_AUDIO_CODEC)
+    # ex. 'opus' or 'mp4a.40.2'
+    acodec = (info.get("acodec", None) or "").split(".")[0].lower()
+    return (REMUX_CODECS.get(acodec, DEFAULT_AUDIO_CODEC))
+
+
+def set_preferred_codec(ydl_opts: dict, codec: str) -> dict:
+    """ Copy of 'ydl_opts' with the FFmpegExtractAudio postprocessor targeting 'codec'. """
+    postprocessors = [pp | {"preferredcodec": codec} if ("FFmpegExtractAudio" == pp["key"]) else pp
+                      for pp in ydl_opts.get("postprocessors", [])]
+    return (ydl_opts | {"postprocessors": postprocessors})
+
+
+def _init_worker(ydl_opts: dict, cover_max_size: int, cover_quality: int,
+                 keep_source_codec: bool, thumbnail_cache_path: str):
+    global _worker_opts
+    _worker_opts = ydl_opts
+    # Spawned workers don't share the globals of the parent process
+    globals.COVER_MAX_SIZE = cover_max_size
+    globals.COVER_QUALITY = cover_quality
+    globals.KEEP_SOURCE_CODEC = keep_source_codec
+    globals.THUMBNAIL_CACHE_PATH = thumbnail_cache_path
+
+
+def _normalize_thumbnails(info: dict):
+    """ Normalize the thumbnails written for a download before they are embedded. """
+    for thumbnail in info.get("thumbnails", None) or []:
+        if (thumbnail.get("filepath", None) and os.path.exists(thumbnail["filepath"])):
+            thumbnail["filepath"] = get_cover_normalizer().normalize_file(thumbnail["filepath"])
+
+
+def _run_postprocessors(filepath: str, info: dict) -> str:
+    """ Run the postprocessor chain of the worker on a downloaded file.
+
+        Returns:
+            Path of the postprocessed file
+    """
+    _normalize_thumbnails(info)
+    codec = preferred_audio_codec(info)
+    if (codec not in _worker_ydls):
+        _worker_ydls[codec] = YoutubeDL(set_preferred_codec(_worker_opts, codec))
+    info = _worker_ydls[codec].post_process(filepath, info)
+    return (info["filepath"])
+
+
+class PostProcessPool:
+    """ Process pool that runs the ffmpeg postprocessors of downloads so that transcoding doesn't
+        hold up the next download. When source codecs are kept, audio that is already opus, vorbis
+        or aac is remuxed instead of being transcoded. Thumbnails are normalized before they are
+        embedded. """
+
+    def __init__(self, ydl_opts: dict, workers: int = None):
+        """
+            Arguments:
+                ydl_opts:   Options of the YoutubeDL that postprocesses. Only the postprocessors
+                            and output related options are used.
+                workers:    Amount of worker processes. Defaults to the cpu count
+        """
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # NOTE: Downloads run on threads and forking a threaded process can deadlock, so the
+        #       workers are spawned
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker,
+                                            initargs=(ydl_opts, globals.COVER_MAX_SIZE,
+                                                      globals.COVER_QUALITY,
+                                                      globals.KEEP_SOURCE_CODEC,
+                                                      globals.THUMBNAIL_CACHE_PATH))
+
+    def submit(self, filepath: str, info: dict):
+        """ Postprocess a downloaded file. 'info' is the info dict of the download.
+
+            Returns:
+                Future of the path of the postprocessed file
+        """
+        return (self.executor.submit(_run_postprocessors, filepath, YoutubeDL.sanitize_info(info)))
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
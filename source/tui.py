@@ -32,6 +32,7 @@
 import io
 import json
 import time
+import atexit
 import textwrap
 import urllib.request
 from datetime import datetime
@@ -42,15 +43,19 @@ import globals
 import downloader
 from textual import work
 from utils.common import MetadataCtx
+from genres import get_genre_registry
 from utils.ctl_logging import tui_log
-from playlists import PlaylistHandler
 from textual.reactive import reactive
 from textual.screen import ModalScreen
 from textual_image.widget import Image
 from textual.css.query import NoMatches
 from textual.app import App, ComposeResult
+from utils.rate_limit import rate_limit_url
+from journal import WorkJournal, JournalState
 from textual.worker import get_current_worker
 from textual.validation import Function, Number
+from playlists import PlaylistHandler, PlaylistCache
+from utils.thumbnail_cache import get_thumbnail_cache
 from report import ReportStatus, get_report_status_str
 from music_brainz import musicbrainz_construct_user_agent
 from metadata import replace_metadata, LyricHandler, fill_report_metadata
@@ -99,19 +104,16 @@ async def obtain_image_from_url(screen, url: str, in_image_id: str):
         if (worker.is_cancelled):
             return
 
-        retrieved_bytes = None
-        try:
-            with urllib.request.urlopen(url) as response:
-                request_response = response.read()
-                retrieved_bytes = io.BytesIO(request_response)
-                break
-        except Exception:
-            screen.app.call_from_thread(tui_log, f"{i}: Image obtain failed...retrying")
-            delay = time.time() + i**2
-            while ((time.time() < delay) and (not worker.is_cancelled)):
-                pass
+        # Retries are done here so waiting between them can be cancelled
+        request_response = get_thumbnail_cache().get(url, retries=1)
+        retrieved_bytes = io.BytesIO(request_response) if request_response else None
+        if (retrieved_bytes):
+            break
 
-            continue
+        screen.app.call_from_thread(tui_log, f"{i}: Image obtain failed...retrying")
+        delay = time.time() + i**2
+        while ((time.time() < delay) and (not worker.is_cancelled)):
+            pass
 
     if (not worker.is_cancelled):
         image_widget = screen.query_one(f"#{in_image_id}", Image)
@@ -167,6 +169,7 @@ class NewUrlInputMenu(ModalScreen):
 
     def validate_url(self, url: str):
         try:
+            rate_limit_url(url)
             with urllib.request.urlopen(url) as response:
                 if response.status == 200:
                     return True
@@ -215,10 +218,10 @@ class EditInputMenu(ModalScreen[MetadataCtx]):
     DATE_FORMAT = "%Y-%m-%d"
     CSS_PATH = "css/editInput.tcss"
     BINDINGS = [("ctrl+h", "help_menu", "Help Menu")]
-    GENRES = json.load(open(globals.GENRE_PATH, 'r'))
 
     def __init__(self, metadata: dict | MetadataCtx, type: str, outdir: str):
 
+        self.genres = get_genre_registry().genres()
         # Override for if metadata is being passed in again for a retry
         if type == "meta":
             self.metadata = asdict(metadata)
@@ -226,7 +229,7 @@ class EditInputMenu(ModalScreen[MetadataCtx]):
             self.output.path = self.metadata["path"]
         else:
             self.metadata = metadata[type]
-            self.output = MetadataCtx()
+            self.output = MetadataCtx(release_mbid=self.metadata.get("mbid", None))
             self.output.path = PurePath(outdir,
                                         self.app.report_dict[
                                             self.app.current_report_key]["pre"]["short_path"])
@@ -316,14 +319,14 @@ class EditInputMenu(ModalScreen[MetadataCtx]):
                     else:
                         select_value = Select.BLANK
 
-                    yield Select(((line, line) for line in self.GENRES), value=select_value,
+                    yield Select(((line, line) for line in self.genres), value=select_value,
                                  classes="EditPageListItem", prompt=f"Genre {i+1}")
                 remainder = self.MAX_GENRE_AMT - len(genre_list)
             else:
                 remainder = self.MAX_GENRE_AMT
 
             for i in range(0, remainder):
-                yield Select(((line, line) for line in self.GENRES), value=Select.BLANK,
+                yield Select(((line, line) for line in self.genres), value=Select.BLANK,
                              classes="EditPageListItem", prompt=f"Genre {i+1}")
 
             yield Label("Thumbnail Link", classes="EditPageLabel")
@@ -362,16 +365,9 @@ class EditInputMenu(ModalScreen[MetadataCtx]):
 
     def validator_is_valid_image(self, image_url: str) -> bool:
 
-        try:
-            tui_log("Attempting to validate image...")
-            with urllib.request.urlopen(image_url) as response:
-                tui_log(f"Image response status: {response.status}")
-                if response.status == 200:
-                    type = response.headers.get("Content-Type")
-                    if type and type.startswith("image"):
-                        return True
-        except Exception:
-            return False
+        tui_log("Attempting to validate image...")
+        # Valid images are cached, so the preview and dimensions don't request them again
+        return (get_thumbnail_cache().dimensions(image_url, retries=1) is not None)
 
     def validator_is_valid_track(self, value) -> bool:
         try:
@@ -458,7 +454,7 @@ class EditInputMenu(ModalScreen[MetadataCtx]):
         if (blurred_widget.input.id == "thumb_link"):
             preview_image = self.query_one("#EditInputUrlPreview", Image)
             if (blurred_widget.input.is_valid):
-                dimensions = get_img_size_url(blurred_widget.value)
+                dimensions = get_img_size_url(blurred_widget.value) or (None, None)
                 self.output.thumbnail_url = blurred_widget.value
                 self.output.thumbnail_width = dimensions[0]
                 self.output.thumbnail_height = dimensions[1]
@@ -507,7 +503,7 @@ class EditInputMenu(ModalScreen[MetadataCtx]):
         # Input Widgets
         for widget in input_widgets:
             if (widget.id == "thumb_link"):
-                dimensions = get_img_size_url(widget.value)
+                dimensions = get_img_size_url(widget.value) or (None, None)
                 self.output.thumbnail_url = widget.value
                 self.output.thumbnail_width = dimensions[0]
                 self.output.thumbnail_height = dimensions[1]
@@ -598,14 +594,26 @@ class ctl_tui(App):
         self.report_path = self.outdir+"ctl_report"
 
         self.playlists_info = []
+        # Playlists only change which playlist files songs are written to, so the cache is used
+        # regardless of its age to start without extracting every playlist
+        playlist_cache = PlaylistCache(self.outdir+"ctl_playlist_cache",
+                                       0 if arguments.refresh_playlists else None)
         self.playlist_handler = PlaylistHandler(arguments.retry_amt,
                                                 arguments.playlists,
                                                 self.playlists_info,
-                                                arguments.request_sleep)
-        self.lyric_handler = LyricHandler(arguments.genius_api_key, verbosity=False)
+                                                arguments.request_sleep,
+                                                arguments.playlist_workers,
+                                                playlist_cache)
+        # Playlist entries are buffered, make sure they are written however the TUI exits
+        atexit.register(self.playlist_handler.flush_playlists)
+        self.lyric_handler = LyricHandler(arguments.genius_api_key, verbosity=False,
+                                          cache_path=self.outdir+"ctl_lyrics_cache")
 
         with open(self.report_path, "r") as fptr:
             self.report_dict = json.load(fptr)
+        # Include entries of a download run that was killed before it could write the report
+        self.journal = WorkJournal(self.outdir+"ctl_journal")
+        self.journal.restore(self.report_dict)
         self.entries_completed = 1
         self.total_entries = len(self.report_dict)
 
@@ -622,8 +630,20 @@ class ctl_tui(App):
             "playlist_handler": self.playlist_handler,
         })
 
+    def on_mount(self) -> None:
+        self.prefetch_lyrics()
+
+    def prefetch_lyrics(self):
+        """ Fill the lyric cache with the lyrics found when the report was filled so tagging
+            does not search Genius for them again. """
+        for report in self.report_dict.values():
+            post = report.get("post", None)
+            if (post):
+                self.lyric_handler.prime(post["title"], post["artist"], post.get("lyrics", None))
+
     def pop_and_increment_report_key(self):
         self.entries_completed += 1
+        self.journal.record(self.current_report_key, JournalState.TAGGED)
         self.report_dict.pop(self.current_report_key)
         self.dump_report()
         self.increment_report_key()
@@ -636,8 +656,8 @@ class ctl_tui(App):
             self.entries_completed += 1
         except StopIteration:
             tui_log("All songs in report exhausted")
-            with open(self.report_path, "w") as f:
-                json.dump(self.report_dict, f, indent=2)
+            self.playlist_handler.flush_playlists()
+            self.final_dump()
             self.exit()
 
     def _get_current_report(self) -> dict:
@@ -768,7 +788,8 @@ class ctl_tui(App):
             ok = replace_metadata(meta, self.lyric_handler)
 
             if (ok):
-                self.playlist_handler.write_to_playlists(meta, self.outdir, None)
+                self.playlist_handler.write_to_playlists(meta, self.outdir, None,
+                                                         source_url=self.current_report_key)
                 self.pop_and_increment_report_key()
             else:
                 self.notify("Failed to replace metadata... Returning to metadata screen",
@@ -794,7 +815,8 @@ class ctl_tui(App):
             ok = replace_metadata(meta, self.lyric_handler)
 
             if (ok):
-                self.playlist_handler.write_to_playlists(meta, self.outdir, None)
+                self.playlist_handler.write_to_playlists(meta, self.outdir, None,
+                                                         source_url=self.current_report_key)
                 self.pop_and_increment_report_key()
             else:
                 self.notify("Failed to replace metadata... Returning to metadata screen",
@@ -843,7 +865,8 @@ class ctl_tui(App):
             ok = replace_metadata(user_input_meta, self.lyric_handler)
 
             if (ok):
-                self.playlist_handler.write_to_playlists(user_input_meta, self.outdir, None)
+                self.playlist_handler.write_to_playlists(user_input_meta, self.outdir, None,
+                                                         source_url=self.current_report_key)
                 self.pop_and_increment_report_key()
             else:
                 self.notify("Failed to replace metadata... Returning to metadata screen",
@@ -885,6 +908,7 @@ class ctl_tui(App):
                                thumbnail_url=post["thumbnail_url"],
                                thumbnail_width=post["thumbnail_width"],
                                thumbnail_height=post["thumbnail_height"],
+                               release_mbid=post.get("mbid", None),
                                playlists=pre["playlists"]
                                )
 
@@ -892,7 +916,8 @@ class ctl_tui(App):
         while not ok:
             ok = replace_metadata(meta, self.lyric_handler)
 
-            self.playlist_handler.write_to_playlists(meta, self.outdir, None)
+            self.playlist_handler.write_to_playlists(meta, self.outdir, None,
+                                                     source_url=self.current_report_key)
 
             if (ok):
                 self.pop_and_increment_report_key()
@@ -929,7 +954,8 @@ class ctl_tui(App):
             ok = replace_metadata(user_input_meta, self.lyric_handler)
 
             if (ok):
-                self.playlist_handler.write_to_playlists(user_input_meta, self.outdir, None)
+                self.playlist_handler.write_to_playlists(user_input_meta, self.outdir, None,
+                                                         source_url=self.current_report_key)
                 self.pop_and_increment_report_key()
             else:
                 self.notify("Failed to replace metadata... Returning to metadata screen",
@@ -941,9 +967,14 @@ class ctl_tui(App):
 
     def action_quit(self):
         tui_log("Exiting TUI")
-        self.dump_report()
+        self.playlist_handler.flush_playlists()
+        self.final_dump()
         self.exit()
 
+    def final_dump(self):
+        """ Dump the report and empty the journal of the entries it holds. """
+        self.journal.checkpoint(self.dump_report, report=self.report_dict)
+
     def dump_report(self):
         tui_log("Dumping report")
         with open(self.report_path, "w") as f:
@@ -30,11 +30,9 @@
 #
 #################################################################################
 
-import io
 import os
 import time
 import glob
-import urllib
 import shutil
 import logging
 import requests
@@ -42,8 +40,9 @@ import subprocess
 from dataclasses import dataclass, field
 
 import globals
-from PIL import Image
+from utils.rate_limit import rate_limit_url
 from yt_dlp import version as yt_dlp_version
+from utils.thumbnail_cache import get_thumbnail_cache
 
 CONNECTIVITY_CHECK_RETRIES = 5
 
@@ -81,6 +80,7 @@ class MetadataCtx:
     thumbnail_url: str = None
     thumbnail_width: int = None
     thumbnail_height: int = None
+    release_mbid: str = None
     genres: list[str] = field(default_factory=list)
     artists: list[str] = field(default_factory=list)
     playlists: list[str] = field(default_factory=list)
@@ -131,18 +131,10 @@ def get_img_size_url(url):
             url (str)
 
         Returns:
-            Tuple of dimensions (width, height)
+            Tuple of dimensions (width, height), None if the image couldn't be obtained
     """
 
-    for _ in range(0, 5):
-        try:
-            with urllib.request.urlopen(url) as response:
-                image_data = response.read()
-            image_size = Image.open(
-                io.BytesIO(image_data)).size
-        except Exception:
-            continue
-    return (image_size)
+    return (get_thumbnail_cache().dimensions(url))
 
 
 def increase_img_req_res(low_res):
@@ -166,6 +158,7 @@ def increase_img_req_res(low_res):
         high_res["url"] = low_res["url"].replace("w120-h120",
                                                  f"w{high_res["width"]}-h{high_res["height"]}")
         try:
+            rate_limit_url(high_res["url"])
             response = requests.head(high_res["url"], timeout=1)
             if (response.status_code == 200):
                 thumbnail_exists = True
@@ -238,6 +231,15 @@ def comma_str_to_list(input: str):
     return (input.split(','))
 
 
+def entry_archive_id(entry: dict):
+    """ Get the yt-dlp download archive id of a (flat) playlist entry. None if it can't be made. """
+    extractor = entry.get("ie_key", None) or entry.get("extractor_key", None)
+    entry_id = entry.get("id", None)
+    if (not (extractor and entry_id)):
+        return (None)
+    return (f"{extractor.lower()} {entry_id}")
+
+
 def url_from_youtube_id(id: str):
     return (f"https://www.youtube.com/watch?v={id}")
 
@@ -0,0 +1,113 @@
+###
+#  @file    image_probe.py
+#
+#  @brief   Image dimensions from header bytes
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import struct
+
+# Bytes from the start of an image that are read to find its dimensions. JPEG dimensions come
+# after any EXIF and ICC segments so this is far more than the other formats need
+IMAGE_PROBE_BYTES = 64 * 1024
+
+# FLAC picture block type
+FLAC_PICTURE_BLOCK = 6
+
+
+def _jpeg_size(header: bytes) -> tuple[int, int]:
+    offset = 2
+    while (offset + 9 <= len(header)):
+        if (0xFF != header[offset]):
+            return None
+        marker = header[offset+1]
+        # Fill bytes and markers without a length
+        if ((0xFF == marker) or (0x01 == marker) or (0xD0 <= marker <= 0xD8)):
+            offset += 1 if (0xFF == marker) else 2
+            continue
+
+        # Start of frame markers, other than DHT, JPG and DAC which share the range
+        if ((0xC0 <= marker <= 0xCF) and (marker not in (0xC4, 0xC8, 0xCC))):
+            height, width = struct.unpack(">HH", header[offset+5:offset+9])
+            return ((width, height))
+        offset += 2 + struct.unpack(">H", header[offset+2:offset+4])[0]
+    return None
+
+
+def _webp_size(header: bytes) -> tuple[int, int]:
+    chunk = header[12:16]
+    if ((b"VP8 " == chunk) and (30 <= len(header))):
+        width, height = struct.unpack("<HH", header[26:30])
+        return ((width & 0x3FFF, height & 0x3FFF))
+    if ((b"VP8L" == chunk) and (25 <= len(header))):
+        bits = int.from_bytes(header[21:25], "little")
+        return (((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1))
+    if ((b"VP8X" == chunk) and (30 <= len(header))):
+        return ((int.from_bytes(header[24:27], "little") + 1,
+                 int.from_bytes(header[27:30], "little") + 1))
+    return None
+
+
+def image_size(header: bytes) -> tuple[int, int]:
+    """ Get (width, height) of a PNG, JPEG, WebP or GIF image from its first bytes.
+
+        Returns:
+            The dimensions, None if they aren't within 'header' or the format is unknown
+    """
+    try:
+        if (header.startswith(b"\x89PNG\r\n\x1a\n") and (b"IHDR" == header[12:16])):
+            return (struct.unpack(">II", header[16:24]))
+        if (header[:6] in (b"GIF87a", b"GIF89a")):
+            return (struct.unpack("<HH", header[6:10]))
+        if ((b"RIFF" == header[:4]) and (b"WEBP" == header[8:12])):
+            return (_webp_size(header))
+        if (header.startswith(b"\xff\xd8")):
+            return (_jpeg_size(header))
+    except struct.error:
+        pass
+    return None
+
+
+def picture_size(block: bytes) -> tuple[int, int]:
+    """ Get (width, height) of a FLAC picture block, as also embedded in Vorbis comments, from
+        its first bytes. The image header is read when the block doesn't state the dimensions.
+
+        Returns:
+            The dimensions, None if they aren't within 'block'
+    """
+    try:
+        # Picture type, then the length prefixed mime type and description
+        offset = 4
+        offset += 4 + struct.unpack(">I", block[offset:offset+4])[0]
+        offset += 4 + struct.unpack(">I", block[offset:offset+4])[0]
+        width, height = struct.unpack(">II", block[offset:offset+8])
+    except struct.error:
+        return None
+
+    if (width and height):
+        return ((width, height))
+    # Color depth, indexed colors and data length precede the image
+    return (image_size(block[offset+20:]))
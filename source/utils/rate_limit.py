@@ -0,0 +1,120 @@
+###
+#  @file    rate_limit.py
+#
+#  @brief   Shared Rate Limiting For Outbound Requests
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Service: (requests per second, burst size)
+RATE_LIMITS = {
+    # https://musicbrainz.org/doc/MusicBrainz_API/Rate_Limiting
+    "musicbrainz": (1.0, 1),
+    "coverartarchive": (1.0, 2),
+    "genius": (2.0, 2),
+    "soundcloud": (2.0, 4),
+    "youtube": (2.0, 4),
+    "default": (4.0, 4),
+}
+
+# Host suffix: Service
+HOST_SERVICES = {
+    "musicbrainz.org": "musicbrainz",
+    "coverartarchive.org": "coverartarchive",
+    "archive.org": "coverartarchive",
+    "genius.com": "genius",
+    "soundcloud.com": "soundcloud",
+    "sndcdn.com": "soundcloud",
+    "youtube.com": "youtube",
+    "youtu.be": "youtube",
+    "ytimg.com": "youtube",
+    "googleusercontent.com": "youtube",
+}
+
+
+class TokenBucket:
+    """ Thread safe token bucket. Tokens are reserved up front so waiting callers are served in
+        the order they arrived. """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """ Block until 'tokens' are available. """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + ((now - self.last_refill) * self.rate))
+            self.last_refill = now
+            self.tokens -= tokens
+            delay = (-self.tokens / self.rate) if (self.tokens < 0) else 0
+
+        if (0 < delay):
+            time.sleep(delay)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(service: str) -> TokenBucket:
+    """ Get the token bucket of 'service'. Unknown services share the default limits. """
+    with _buckets_lock:
+        bucket = _buckets.get(service, None)
+        if (bucket is None):
+            rate, capacity = RATE_LIMITS.get(service, RATE_LIMITS["default"])
+            bucket = TokenBucket(rate, capacity)
+            _buckets[service] = bucket
+    return (bucket)
+
+
+def service_from_url(url: str) -> str:
+    """ Get the name of the service that 'url' belongs to. """
+    host = (urlparse(url).hostname or "") if url else ""
+    for suffix, service in HOST_SERVICES.items():
+        if ((host == suffix) or host.endswith('.' + suffix)):
+            return (service)
+    return ("default")
+
+
+def rate_limit(service: str, tokens: float = 1):
+    """ Wait until a request to 'service' is allowed. """
+    get_bucket(service.lower() if service else "default").acquire(tokens)
+
+
+def rate_limit_url(url: str, tokens: float = 1):
+    """ Wait until a request to the service hosting 'url' is allowed. """
+    rate_limit(service_from_url(url), tokens)
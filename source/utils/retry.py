@@ -0,0 +1,245 @@
+###
+#  @file    retry.py
+#
+#  @brief   Retry Scheduling And Circuit Breaking
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 120
+
+# Consecutive failures before a provider is paused
+BREAKER_FAILURE_THRESHOLD = 5
+# Seconds a provider is paused for before a single trial request is let through
+BREAKER_COOLDOWN = 300
+# Seconds after which a trial request that never reported back is given up on
+BREAKER_TRIAL_TIMEOUT = 900
+
+
+class ProviderUnavailableError(Exception):
+    """ Raised when a provider is paused by its circuit breaker or keeps failing, so that the work
+        can be deferred instead of being treated as having no result. """
+
+    def __init__(self, provider: str, retry_after: float = 0):
+        super().__init__(f"{provider} is unavailable")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY,
+                  cap: float = RETRY_MAX_DELAY) -> float:
+    """ Exponential backoff with full jitter for the given attempt (starting at 1). """
+    return (random.uniform(0, min(cap, base * (2 ** max(attempt-1, 0)))))
+
+
+class CircuitBreaker:
+    """ Pauses a provider after repeated consecutive failures.
+
+        Once 'failure_threshold' failures happen in a row the breaker opens and requests are not
+        allowed until 'cooldown' seconds have passed. After that a single trial request is allowed
+        through. Success closes the breaker and failure opens it again. A trial whose outcome says
+        nothing about the provider is released with release_trial(), and a trial that doesn't
+        report back within 'trial_timeout' seconds is given up on so another can be made.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN, trial_timeout: float = BREAKER_TRIAL_TIMEOUT):
+        self.name = name
+        self.cooldown = cooldown
+        self.trial_timeout = trial_timeout
+        self.failure_threshold = failure_threshold
+        self.failures = 0
+        self.opened_at = None
+        # When the breaker opened after its last success, kept while trials reopen it
+        self.first_opened_at = None
+        self.trial_started = None
+        self.lock = threading.Lock()
+
+    def _trial_in_flight(self, now: float) -> bool:
+        """ Whether a trial request is pending. Requires lock. """
+        return ((self.trial_started is not None)
+                and ((now - self.trial_started) < self.trial_timeout))
+
+    def _retry_after(self, now: float) -> float:
+        """ Seconds until a request will be allowed again. Requires lock. """
+        if (self.opened_at is None):
+            return 0
+        if (self._trial_in_flight(now)):
+            return (self.trial_started + self.trial_timeout - now)
+        return (max(0, self.cooldown - (now - self.opened_at)))
+
+    def available(self) -> bool:
+        """ Whether a request would currently be allowed. Does not claim the trial request. """
+        with self.lock:
+            return (0 == self._retry_after(time.monotonic()))
+
+    def allow(self) -> bool:
+        """ Whether a request is allowed. Claims the trial request of an open breaker. """
+        with self.lock:
+            if (self.opened_at is None):
+                return True
+            now = time.monotonic()
+            if (0 < self._retry_after(now)):
+                return False
+            self.trial_started = now
+            return True
+
+    def retry_after(self) -> float:
+        """ Seconds until a request will be allowed again. """
+        with self.lock:
+            return (self._retry_after(time.monotonic()))
+
+    def open_for(self) -> float:
+        """ Seconds the breaker has stayed open without a successful request, 0 if closed. """
+        with self.lock:
+            if (self.first_opened_at is None):
+                return 0
+            return (time.monotonic() - self.first_opened_at)
+
+    def release_trial(self):
+        """ Give up the trial request without judging the provider, ex. the request failed for a
+            reason unrelated to the provider. The next request becomes the trial. """
+        with self.lock:
+            self.trial_started = None
+
+    def record_success(self):
+        with self.lock:
+            if (self.opened_at is not None):
+                logger.info(f"{self.name} recovered, resuming requests")
+            self.failures = 0
+            self.opened_at = None
+            self.first_opened_at = None
+            self.trial_started = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if ((self.trial_started is not None)
+                    or ((self.opened_at is None) and (self.failure_threshold <= self.failures))):
+                logger.warning(f"{self.name} failed {self.failures} times in a row. "
+                               f"Pausing requests for {self.cooldown}s")
+                self.opened_at = time.monotonic()
+                if (self.first_opened_at is None):
+                    self.first_opened_at = self.opened_at
+                self.trial_started = None
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """ Get the shared circuit breaker of 'provider'. """
+    name = (provider or "default").lower()
+    with _breakers_lock:
+        if (name not in _breakers):
+            _breakers[name] = CircuitBreaker(name)
+        return (_breakers[name])
+
+
+class RetryScheduler:
+    """ Queue of work items grouped by key (usually a provider).
+
+        Items are handed out oldest first. Items pushed with a delay are held back until the delay
+        has passed and then join the back of the queue, so other work proceeds in the meantime.
+        Not thread safe.
+    """
+
+    def __init__(self):
+        self._sequence = itertools.count()
+        self._ready = {}
+        self._delayed = []
+
+    def __len__(self):
+        return (sum(len(items) for items in self._ready.values()) + len(self._delayed))
+
+    def push(self, item, key=None, delay: float = 0):
+        if (0 < delay):
+            heapq.heappush(self._delayed,
+                           (time.monotonic() + delay, next(self._sequence), key, item))
+        else:
+            self._ready.setdefault(key, deque()).append((next(self._sequence), item))
+
+    def _promote(self):
+        now = time.monotonic()
+        while (self._delayed and self._delayed[0][0] <= now):
+            _, _, key, item = heapq.heappop(self._delayed)
+            self._ready.setdefault(key, deque()).append((next(self._sequence), item))
+
+    def keys(self) -> set:
+        """ Keys that have items, ready or delayed. """
+        return (set(self._ready) | {key for _, _, key, _ in self._delayed})
+
+    def ready_keys(self) -> list:
+        """ Keys that have items ready to be handed out. """
+        self._promote()
+        return (list(self._ready))
+
+    def pop(self, is_available=None):
+        """ Pop the oldest ready item whose key passes 'is_available'. None if there is none. """
+        self._promote()
+        oldest_key = None
+        for key, items in self._ready.items():
+            if ((is_available is not None) and (not is_available(key))):
+                continue
+            if ((oldest_key is None) or (items[0][0] < self._ready[oldest_key][0][0])):
+                oldest_key = key
+
+        if (oldest_key is None):
+            return None
+
+        _, item = self._ready[oldest_key].popleft()
+        if (not self._ready[oldest_key]):
+            self._ready.pop(oldest_key)
+        return (item)
+
+    def next_ready_in(self) -> float:
+        """ Seconds until the next delayed item is ready. None if there are no delayed items. """
+        if (not self._delayed):
+            return None
+        return (max(0, self._delayed[0][0] - time.monotonic()))
+
+    def drain(self, key) -> list:
+        """ Remove and get every item of 'key', ready or delayed. """
+        items = [item for _, item in self._ready.pop(key, [])]
+        items.extend(item for _, _, item_key, item in self._delayed if (item_key == key))
+        self._delayed = [delayed for delayed in self._delayed if (delayed[2] != key)]
+        heapq.heapify(self._delayed)
+        return (items)
+
+    def clear(self):
+        self._ready.clear()
+        self._delayed.clear()
@@ -0,0 +1,316 @@
+###
+#  @file    thumbnail_cache.py
+#
+#  @brief   Content addressed cache of downloaded thumbnails
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import io
+import os
+import json
+import time
+import fcntl
+import atexit
+import hashlib
+import logging
+import threading
+import urllib.request
+from pathlib import PurePath
+
+import globals
+from PIL import Image
+from utils.retry import backoff_delay
+from utils.rate_limit import rate_limit_url
+from utils.image_probe import image_size, IMAGE_PROBE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Bytes of thumbnails kept before the least recently used ones are evicted
+THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+THUMBNAIL_FETCH_RETRIES = 5
+THUMBNAIL_FETCH_TIMEOUT = 30
+THUMBNAIL_INDEX_NAME = "index.json"
+# Images stored between writes of the index, the rest is written at exit
+THUMBNAIL_FLUSH_INTERVAL = 32
+
+
+def image_dimensions(data: bytes) -> tuple[int, int]:
+    """ Get (width, height) of an image, (None, None) if it can't be read. """
+    size = image_size(data[:IMAGE_PROBE_BYTES])
+    if (size):
+        return (size)
+    # Formats the header probe doesn't know
+    try:
+        return (Image.open(io.BytesIO(data)).size)
+    except Exception:
+        return (None, None)
+
+
+class ThumbnailCache:
+    """ Cache of downloaded thumbnails keyed by url and content hash.
+
+        Every image is stored once under the sha256 of its content, and urls map to those hashes
+        so that urls serving the same image share one file. The dimensions of every image are
+        stored with it. Once the cache grows past 'max_bytes' the least recently used images are
+        evicted. Without a path images are only kept in memory.
+
+        Images derived from other images, ex. normalized covers, are stored with put() under keys
+        of their own. Several processes can share the cache, the index written by flush() is
+        merged with the entries other processes wrote since it was loaded.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # url: [lock held while the url is fetched so concurrent callers share one request,
+        #       amount of callers using the lock]. Removed once no caller uses it
+        self.url_locks = {}
+        # url: content hash
+        self.urls = {}
+        # content hash: {"size", "width", "height", "used"}
+        self.blobs = {}
+        # content hash: bytes, only used without a path
+        self.memory = {}
+        self.dirty = False
+        self.unflushed_stores = 0
+        self._load()
+
+    def _blob_path(self, digest: str) -> PurePath:
+        return (PurePath(self.path, digest))
+
+    def _read_index(self) -> (dict, dict):
+        """ Read the (urls, blobs) of the index on disk, leaving out images that were evicted. """
+        try:
+            with open(PurePath(self.path, THUMBNAIL_INDEX_NAME), "r") as fptr:
+                index = json.load(fptr)
+            urls = index["urls"]
+            blobs = index["blobs"]
+        except FileNotFoundError:
+            return ({}, {})
+        except (OSError, ValueError, KeyError):
+            logger.warning("Thumbnail cache index is unreadable, starting with an empty cache")
+            return ({}, {})
+
+        # Images may have been evicted by another process sharing the cache
+        blobs = {digest: blob for digest, blob in blobs.items()
+                 if os.path.exists(self._blob_path(digest))}
+        urls = {url: digest for url, digest in urls.items() if digest in blobs}
+        return (urls, blobs)
+
+    def _load(self):
+        if (not self.path):
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        self.urls, self.blobs = self._read_index()
+
+    def _read(self, digest: str) -> bytes:
+        if (not self.path):
+            return (self.memory.get(digest, None))
+        try:
+            with open(self._blob_path(digest), "rb") as fptr:
+                return (fptr.read())
+        except OSError:
+            return None
+
+    def _lookup(self, url: str) -> bytes:
+        """ Get the cached image of 'url', marking it as recently used. """
+        with self.lock:
+            digest = self.urls.get(url, None)
+            if (digest is None):
+                return None
+
+            data = self._read(digest)
+            if (data is None):
+                self.urls.pop(url)
+                self.blobs.pop(digest, None)
+            else:
+                self.blobs[digest]["used"] = time.time()
+            self.dirty = True
+            return (data)
+
+    def _store(self, url: str, data: bytes) -> bool:
+        """ Cache the image of 'url'. Returns False, caching nothing, if 'data' isn't an image. """
+        width, height = image_dimensions(data)
+        if (width is None):
+            logger.debug(f"Not caching '{url}', the response is not a readable image")
+            return False
+
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self.lock:
+            if (digest not in self.blobs):
+                if (self.path):
+                    tmp_path = str(self._blob_path(digest)) + ".tmp"
+                    with open(tmp_path, "wb") as fptr:
+                        fptr.write(data)
+                    os.replace(tmp_path, self._blob_path(digest))
+                else:
+                    self.memory[digest] = data
+                self.blobs[digest] = {"size": len(data), "width": width, "height": height}
+            self.blobs[digest]["used"] = time.time()
+            self.urls[url] = digest
+            self._evict()
+            self.dirty = True
+            self.unflushed_stores += 1
+            flush = (THUMBNAIL_FLUSH_INTERVAL <= self.unflushed_stores)
+        if (flush):
+            self.flush()
+        return True
+
+    def _evict(self):
+        """ Evict least recently used images until the cache fits in max_bytes. Requires lock. """
+        total = sum(blob["size"] for blob in self.blobs.values())
+        if (total <= self.max_bytes):
+            return
+
+        for digest, blob in sorted(self.blobs.items(), key=lambda item: item[1]["used"]):
+            if (total <= self.max_bytes):
+                break
+            if (self.path):
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+            else:
+                self.memory.pop(digest, None)
+            self.blobs.pop(digest)
+            total -= blob["size"]
+
+        self.urls = {url: digest for url, digest in self.urls.items() if digest in self.blobs}
+
+    def _merge_index(self):
+        """ Add the entries written to the index by other processes. Requires lock. """
+        urls, blobs = self._read_index()
+        for digest, blob in blobs.items():
+            if (digest in self.blobs):
+                self.blobs[digest]["used"] = max(self.blobs[digest]["used"], blob["used"])
+            else:
+                self.blobs[digest] = blob
+        for url, digest in urls.items():
+            self.urls.setdefault(url, digest)
+        self._evict()
+
+    def _fetch(self, url: str, retries: int) -> bytes:
+        for attempt in range(1, retries+1):
+            try:
+                rate_limit_url(url)
+                with urllib.request.urlopen(url, timeout=THUMBNAIL_FETCH_TIMEOUT) as response:
+                    return (response.read())
+            except Exception as e:
+                logger.debug(f"Thumbnail request {attempt}/{retries} failed for '{url}': {e}")
+                if (attempt < retries):
+                    time.sleep(backoff_delay(attempt))
+        return None
+
+    def get(self, url: str, retries: int = THUMBNAIL_FETCH_RETRIES) -> bytes:
+        """ Get the image at 'url', downloading it if it isn't cached.
+
+            Returns:
+                The image bytes, None if it couldn't be downloaded or isn't an image
+        """
+        if (not url):
+            return None
+
+        with self.lock:
+            url_lock = self.url_locks.setdefault(url, [threading.Lock(), 0])
+            url_lock[1] += 1
+
+        try:
+            with url_lock[0]:
+                data = self._lookup(url)
+                if (data is None):
+                    data = self._fetch(url, retries)
+                    if ((data is not None) and (not self._store(url, data))):
+                        data = None
+        finally:
+            with self.lock:
+                url_lock[1] -= 1
+                if (not url_lock[1]):
+                    self.url_locks.pop(url)
+        return (data)
+
+    def lookup(self, key: str) -> bytes:
+        """ Get the image cached under 'key' without downloading anything. None if it isn't
+            cached. """
+        return (self._lookup(key))
+
+    def put(self, key: str, data: bytes) -> bool:
+        """ Cache the image 'data' under 'key'. Returns False if 'data' isn't an image. """
+        return (self._store(key, data))
+
+    def dimensions(self, url: str, retries: int = THUMBNAIL_FETCH_RETRIES) -> tuple[int, int]:
+        """ Get (width, height) of the image at 'url', downloading it if it isn't cached.
+
+            Returns:
+                The dimensions, None if the image couldn't be downloaded or read
+        """
+        if (self.get(url, retries) is None):
+            return None
+
+        with self.lock:
+            blob = self.blobs.get(self.urls.get(url, None), None)
+            if ((blob is None) or (blob["width"] is None)):
+                return None
+            return ((blob["width"], blob["height"]))
+
+    def flush(self):
+        """ Write the index if it changed. """
+        if (not self.path):
+            return
+
+        with self.lock:
+            if (not self.dirty):
+                return
+            # The index itself is replaced on every write so the cache directory is locked
+            dir_fd = os.open(self.path, os.O_RDONLY)
+            try:
+                fcntl.flock(dir_fd, fcntl.LOCK_EX)
+                self._merge_index()
+                index_path = PurePath(self.path, THUMBNAIL_INDEX_NAME)
+                tmp_path = str(index_path) + ".tmp"
+                with open(tmp_path, "w") as fptr:
+                    json.dump({"urls": self.urls, "blobs": self.blobs}, fptr)
+                os.replace(tmp_path, index_path)
+            finally:
+                os.close(dir_fd)
+            self.dirty = False
+            self.unflushed_stores = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """ Get the thumbnail cache of the process, stored at globals.THUMBNAIL_CACHE_PATH. """
+    global _cache
+    with _cache_lock:
+        if (_cache is None):
+            _cache = ThumbnailCache(globals.THUMBNAIL_CACHE_PATH)
+            atexit.register(_cache.flush)
+        return (_cache)
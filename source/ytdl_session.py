@@ -0,0 +1,92 @@
+###
+#  @file    ytdl_session.py
+#
+#  @brief   Reusable YoutubeDL Sessions
+#
+#
+#  @copyright (c) 2026 CloudToLocal Contributors
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+#
+#
+#################################################################################
+
+import logging
+import threading
+
+from yt_dlp import YoutubeDL
+
+logger = logging.getLogger(__name__)
+
+
+class YoutubeDLSession:
+    """ Hands out YoutubeDL instances that are constructed once and reused for the whole run.
+
+        Constructing a YoutubeDL loads every extractor, builds the postprocessor chain and reads
+        the download archive so it is too expensive to do per entry. YoutubeDL is not thread
+        safe, so every thread is given its own instance.
+    """
+
+    def __init__(self, ydl_opts: dict, archive: set = None):
+        """
+            Arguments:
+                ydl_opts:   Options passed to every YoutubeDL instance
+                archive:    Set of archive ids to use instead of the one loaded by YoutubeDL
+        """
+        self.ydl_opts = dict(ydl_opts)
+        self._local = threading.local()
+        self._instances = []
+        self._instances_lock = threading.Lock()
+        self._base_archive = archive
+        self._archive = archive
+
+    def get(self) -> YoutubeDL:
+        """ Get the YoutubeDL instance of the calling thread, creating it if needed. """
+        ydl = getattr(self._local, "ydl", None)
+        if (ydl is None):
+            logger.debug(f"Creating YoutubeDL instance for {threading.current_thread().name}")
+            # YoutubeDL keeps a reference to the options passed so each instance gets a copy
+            ydl = YoutubeDL(dict(self.ydl_opts))
+            self._local.ydl = ydl
+            with self._instances_lock:
+                # Share the archive between instances so that an entry recorded by one thread
+                # is seen by the others
+                if (self._archive is None):
+                    self._archive = ydl.archive
+                else:
+                    ydl.archive = self._archive
+                self._instances.append(ydl)
+        return (ydl)
+
+    def close(self):
+        """ Close every instance created by the session. """
+        with self._instances_lock:
+            instances = self._instances
+            self._instances = []
+        for ydl in instances:
+            ydl.close()
+        self._archive = self._base_archive
+        self._local = threading.local()
+
+    def __enter__(self):
+        return (self)
+
+    def __exit__(self, *args):
+        self.close()